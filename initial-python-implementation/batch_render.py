@@ -0,0 +1,215 @@
+import argparse
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from render_pool import SharedRenderPool
+from song import load_song, find_song_files
+from synth import write_wav
+
+
+def render_song_file(song_path, output_dir, stems=False, output_name=None, pool=None):
+    """Render one song file to WAV (and optional stems), returning a result dict
+
+    Outputs are named output_name, by default the song file's name without
+    its extension (not the song's "name", which several files may share).
+    With a SharedRenderPool its tracks are rendered in parallel.
+
+    Runs in a worker process. Errors are caught here so one bad song never
+    takes down the rest of the batch.
+    """
+    started = time.perf_counter()
+    try:
+        song = load_song(song_path)
+        if output_name is None:
+            output_name = os.path.splitext(os.path.basename(song_path))[0]
+        seq = song.sequencer
+        output = seq.render(song.duration, song.num_of_loops, pool=pool)
+
+        wav_path = os.path.join(output_dir, f"{output_name}.wav")
+        write_wav(wav_path, output, seq.sample_rate)
+        written = [wav_path]
+
+        if stems:
+            stem_dir = os.path.join(output_dir, f"{output_name}_stems")
+            os.makedirs(stem_dir, exist_ok=True)
+            for index, (track_name, stem) in enumerate(seq.render_stems(song.duration, song.num_of_loops)):
+                stem_path = os.path.join(stem_dir, f"{index:02d}-{safe_file_name(track_name)}.wav")
+                write_wav(stem_path, stem, seq.sample_rate)
+                written.append(stem_path)
+
+        return {
+            "song": song_path,
+            "ok": True,
+            "files": written,
+            "audio_seconds": len(output) / seq.sample_rate,
+            "render_seconds": time.perf_counter() - started,
+        }
+    except Exception as e:
+        return {
+            "song": song_path,
+            "ok": False,
+            "error": f"{type(e).__name__}: {e}",
+            "audio_seconds": 0.0,
+            "render_seconds": time.perf_counter() - started,
+        }
+
+
+def failed_result(song_path, error):
+    return {
+        "song": song_path,
+        "ok": False,
+        "error": error,
+        "audio_seconds": 0.0,
+        "render_seconds": 0.0,
+    }
+
+
+def safe_file_name(name):
+    """Track names can hold anything, keep only characters that are safe in a file name"""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._") or "track"
+
+
+# Worker side: where each worker reports the song it is about to render
+_started_songs = None
+
+
+def _start_worker(started_songs):
+    global _started_songs
+    _started_songs = started_songs
+
+
+def _render_in_worker(song_path, output_dir, stems, output_name):
+    # A SimpleQueue write goes straight to the pipe, so it survives the worker dying right after
+    _started_songs.put(song_path)
+    return render_song_file(song_path, output_dir, stems, output_name)
+
+
+def run_pool(jobs, output_dir, workers, stems, on_result):
+    """Render (song path, output name) jobs in a fresh pool until they finish or it breaks
+
+    Returns the jobs lost to a broken pool as (job, started) pairs, where
+    started tells whether the job was already running in a worker.
+    """
+    started_songs = multiprocessing.SimpleQueue()
+    lost = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(started_songs,)) as pool:
+        futures = {pool.submit(_render_in_worker, path, output_dir, stems, name): (path, name)
+                   for path, name in jobs}
+        for future in as_completed(futures):
+            try:
+                on_result(future.result())
+            except BrokenProcessPool:
+                lost.append(futures[future])
+
+    started = set()
+    while not started_songs.empty():
+        started.add(started_songs.get())
+    return [(job, job[0] in started) for job in lost]
+
+
+def render_in_pools(jobs, output_dir, workers, stems, on_result):
+    """Render (song path, output name) jobs, replacing the pool whenever a worker dies"""
+    # A killed worker (e.g. out of memory) breaks the whole pool. Songs that hadn't
+    # started are simply submitted again to a new pool; the ones that were running
+    # are retried once, alone, so only a song that kills its worker twice fails.
+    pending = list(jobs)
+    suspects = []
+    while pending or suspects:
+        retrying = bool(suspects)
+        if retrying:
+            batch, pool_workers, suspects = suspects, 1, []
+        else:
+            batch, pool_workers, pending = pending, workers, []
+        lost = run_pool(batch, output_dir, pool_workers, stems, on_result)
+
+        if lost and len(lost) == len(batch) and not any(was_started for _, was_started in lost):
+            # Nothing ran at all, the workers themselves can't start
+            for (path, _), _ in lost:
+                on_result(failed_result(path, "BrokenProcessPool: worker processes could not start"))
+            continue
+        for job, was_started in lost:
+            if not was_started:
+                (suspects if retrying else pending).append(job)
+            elif retrying:
+                on_result(failed_result(job[0], "BrokenProcessPool: the worker rendering this song died twice"))
+            else:
+                suspects.append(job)
+
+
+def output_names(song_files):
+    """Unique output name per song file: its base name, numbered when two collide"""
+    names = []
+    taken = set()
+    for path in song_files:
+        base = os.path.splitext(os.path.basename(path))[0]
+        name = base
+        suffix = 2
+        while name in taken:
+            name = f"{base}-{suffix}"
+            suffix += 1
+        taken.add(name)
+        names.append(name)
+    return names
+
+
+def batch_render(song_paths, output_dir, workers=None, stems=False, report=print):
+    """Render many songs concurrently in a process pool and report throughput"""
+    os.makedirs(output_dir, exist_ok=True)
+    song_files = find_song_files(song_paths)
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        report(format_result(result))
+
+    started = time.perf_counter()
+    jobs = list(zip(song_files, output_names(song_files)))
+    if len(jobs) == 1 and workers != 1:
+        # One song can't keep a pool of songs busy, spread its tracks over the workers instead
+        (song_path, output_name), = jobs
+        with SharedRenderPool(workers) as pool:
+            on_result(render_song_file(song_path, output_dir, stems, output_name, pool=pool))
+    else:
+        render_in_pools(jobs, output_dir, workers, stems, on_result)
+    wall_seconds = time.perf_counter() - started
+
+    report(format_summary(results, wall_seconds))
+    return results
+
+
+def format_result(result):
+    if not result["ok"]:
+        return f"FAIL {result['song']}: {result['error']}"
+    speed = result["audio_seconds"] / result["render_seconds"] if result["render_seconds"] else 0.0
+    return (f"ok   {result['song']}: {result['audio_seconds']:.1f}s audio "
+            f"in {result['render_seconds']:.2f}s ({speed:.1f}x realtime)")
+
+
+def format_summary(results, wall_seconds):
+    rendered = [r for r in results if r["ok"]]
+    audio_seconds = sum(r["audio_seconds"] for r in rendered)
+    speed = audio_seconds / wall_seconds if wall_seconds else 0.0
+    return (f"Rendered {len(rendered)}/{len(results)} songs, {audio_seconds:.1f}s audio "
+            f"in {wall_seconds:.2f}s ({speed:.1f}x realtime)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render song definitions to WAV files")
+    parser.add_argument("songs", nargs="+", help="Song .json or MIDI files, or directories of them")
+    parser.add_argument("-o", "--output-dir", default="renders")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument("--stems", action="store_true", help="Also write one WAV per track")
+    args = parser.parse_args()
+
+    results = batch_render(args.songs, args.output_dir, workers=args.workers, stems=args.stems)
+    if not all(r["ok"] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
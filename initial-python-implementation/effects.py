@@ -0,0 +1,72 @@
+import numpy as np
+
+
+# LSDJ style commands, written as a letter plus two hex digits `xy`, e.g. "A37"
+#   A xy  arpeggio: cycle root, +x and +y semitones, one step per tick
+#   V xy  vibrato: x Hz rate, y/8 semitones depth
+#   P xy  pitch slide: xy as a signed byte, in 1/16 semitone per tick
+#   E xy  volume sweep: ramp to x/15 of the note volume over y ticks (0 = whole note)
+#   W xy  duty cycle change for square waves: 12.5%, 25%, 50%, 75% for y = 0..3
+EFFECT_COMMANDS = ["A", "V", "P", "E", "W"]
+DUTY_CYCLES = [0.125, 0.25, 0.5, 0.75]
+
+# Effects advance once per tick, 6 ticks per 16th note row like LSDJ
+TICKS_PER_BEAT = 24
+
+
+def parse_effect(text):
+    """Parse "A37" into ("A", 0x37), raising ValueError for anything else"""
+    text = text.strip().upper()
+    if len(text) != 3 or text[0] not in EFFECT_COMMANDS:
+        raise ValueError(f"Unsupported effect: {text!r}")
+    return text[0], int(text[1:], 16)
+
+
+def format_effect(command, param):
+    return f"{command}{param:02X}"
+
+
+def normalize_effects(effects):
+    """Accept effects as "A37" strings or (command, param) pairs"""
+    return tuple(parse_effect(effect) if isinstance(effect, str) else (effect[0], int(effect[1]))
+                 for effect in effects)
+
+
+def effect_curves(effects, frequency, num_samples, bpm, sample_rate=44100):
+    """Per-sample frequency, amplitude and duty cycle for a note's effects
+
+    Every effect is evaluated over the whole note at once with numpy, so
+    the cost doesn't depend on how many ticks the note spans.
+    Returns (frequency curve, amplitude curve or None, duty cycle).
+    """
+    samples = np.arange(num_samples)
+    tick_len = sample_rate * 60 / bpm / TICKS_PER_BEAT
+    ticks = (samples // tick_len).astype(np.int64)
+
+    semitones = np.zeros(num_samples)
+    amplitude = None
+    duty_cycle = 0.5
+
+    for command, param in effects:
+        x, y = param >> 4, param & 0xF
+        if command == "A":
+            semitones += np.array([0, x, y])[ticks % 3]
+        elif command == "V":
+            semitones += (y / 8) * np.sin(2 * np.pi * x * samples / sample_rate)
+        elif command == "P":
+            step = param - 256 if param > 127 else param
+            semitones += ticks * (step / 16)
+        elif command == "E":
+            sweep_len = int(y * tick_len) if y else num_samples
+            sweep_len = max(min(sweep_len, num_samples), 1)
+            curve = np.full(num_samples, x / 15)
+            curve[:sweep_len] = np.linspace(1.0, x / 15, sweep_len)
+            amplitude = curve if amplitude is None else amplitude * curve
+        elif command == "W":
+            duty_cycle = DUTY_CYCLES[y % len(DUTY_CYCLES)]
+
+    if semitones.any():
+        frequencies = frequency * np.exp2(semitones / 12)
+    else:
+        frequencies = np.full(num_samples, frequency)
+    return frequencies, amplitude, duty_cycle
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+
+from effects import format_effect
+from instruments import Instrument, instrument_bank
+from notes import NoteEvent
+from sequencer import Track, Sequencer
+from song import Song, load_song, EVENT_STREAM_EXTENSIONS
+
+
+MAGIC = b"CBES"
+VERSION = 1
+EVENT_STREAM_EXTENSION = EVENT_STREAM_EXTENSIONS[0]
+# Event times are whole ticks; the exporter picks the coarsest resolution that
+# holds every note exactly (tracker grids fit 96, common MIDI divisions the rest)
+TICK_RESOLUTIONS = (96, 480, 960, 1920, 3840, 7680)
+
+NOTE_ON = 0x01
+END = 0x00
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def choose_ticks_per_beat(beats):
+    for resolution in TICK_RESOLUTIONS:
+        if all(abs(beat * resolution - round(beat * resolution)) < 1e-6 for beat in beats):
+            return resolution
+    # Off every grid, quantize to the finest one (well under a millisecond)
+    return TICK_RESOLUTIONS[-1]
+
+
+def instrument_definition(instrument):
+    definition = dict(vars(instrument))
+    if definition["wavetable"] is not None:
+        definition["wavetable"] = [float(value) for value in definition["wavetable"]]
+    return definition
+
+
+def encode_event_stream(song):
+    """Serialize a Song as a time-ordered stream of note-on events
+
+    Everything a note needs except its timing (pitch, volume, waveform,
+    effects, instrument) goes into a patch table once, so each event is just
+    a delta time, a track, a patch and a duration, a few bytes as varints.
+    The whole stream after the magic and version is zlib compressed.
+    """
+    seq = song.sequencer
+    events = [(note.start_beat, track_index, note)
+              for track_index, track in enumerate(seq.tracks) for note in track.notes]
+    events.sort(key=lambda event: (event[0], event[1]))
+    ticks_per_beat = choose_ticks_per_beat(
+        [beat for beat, _, note in events for beat in (beat, note.duration_beats)])
+
+    patches = {}
+    instrument_ids = {}
+    body = bytearray()
+    previous_tick = 0
+    for start_beat, track_index, note in events:
+        if note.instrument is not None and note.instrument not in instrument_ids:
+            instrument_ids[note.instrument] = len(instrument_ids)
+        patch = (note.note, note.volume, note.waveform_type, note.effects, instrument_ids.get(note.instrument))
+        patch_index = patches.setdefault(patch, len(patches))
+
+        tick = round(start_beat * ticks_per_beat)
+        body.append(NOTE_ON)
+        write_varint(body, tick - previous_tick)
+        write_varint(body, track_index)
+        write_varint(body, patch_index)
+        write_varint(body, round(note.duration_beats * ticks_per_beat))
+        previous_tick = tick
+    body.append(END)
+
+    header = {
+        "name": song.name,
+        "bpm": seq.bpm,
+        "tempo_changes": list(seq.tempo_map.changes),
+        "sample_rate": seq.sample_rate,
+        "channels": seq.channels,
+        "duration": song.duration,
+        "num_of_loops": song.num_of_loops,
+        "ticks_per_beat": ticks_per_beat,
+        "tracks": [{"name": track.name, "pan": track.pan} for track in seq.tracks],
+        "instruments": [instrument_definition(instrument_bank.instruments[instrument_id])
+                        for instrument_id in instrument_ids],
+        "patches": [[note, volume, waveform_type, [format_effect(*effect) for effect in effects], instrument]
+                    for note, volume, waveform_type, effects, instrument in patches],
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    payload = struct.pack("<I", len(header_bytes)) + header_bytes + bytes(body)
+    return MAGIC + bytes([VERSION]) + zlib.compress(payload, 9)
+
+
+def decode_event_stream(data, default_name="song"):
+    """Rebuild the Song an event stream was exported from"""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a ChipBoy event stream")
+    if data[4] != VERSION:
+        raise ValueError(f"Unsupported event stream version {data[4]}")
+    payload = zlib.decompress(data[5:])
+    (header_len,) = struct.unpack_from("<I", payload)
+    header = json.loads(payload[4:4 + header_len])
+
+    # Instruments are stored by definition, ids are only meaningful in this process's bank
+    instrument_ids = [instrument_bank.find_or_add(Instrument(**definition))
+                      for definition in header["instruments"]]
+    patches = [(note, volume, waveform_type, effects, None if instrument is None else instrument_ids[instrument])
+               for note, volume, waveform_type, effects, instrument in header["patches"]]
+
+    tracks = [Track(track["name"], pan=track["pan"]) for track in header["tracks"]]
+    track_notes = [[] for _ in tracks]
+    ticks_per_beat = header["ticks_per_beat"]
+    pos = 4 + header_len
+    tick = 0
+    while payload[pos] != END:
+        if payload[pos] != NOTE_ON:
+            raise ValueError(f"Unknown event {payload[pos]:#04x} at byte {pos}")
+        delta, pos = read_varint(payload, pos + 1)
+        track_index, pos = read_varint(payload, pos)
+        patch_index, pos = read_varint(payload, pos)
+        duration, pos = read_varint(payload, pos)
+        tick += delta
+        note, volume, waveform_type, effects, instrument = patches[patch_index]
+        track_notes[track_index].append(NoteEvent(
+            note, start_beat=tick / ticks_per_beat, duration_beats=duration / ticks_per_beat,
+            volume=volume, waveform_type=waveform_type, effects=effects, instrument=instrument))
+
+    sequencer = Sequencer(bpm=header["bpm"], sample_rate=header["sample_rate"], channels=header["channels"],
+                          tempo_changes=header["tempo_changes"])
+    for track, notes in zip(tracks, track_notes):
+        track.add_notes(notes)
+        sequencer.add_track(track)
+    return Song(header["name"] or default_name, sequencer, header["duration"], header["num_of_loops"])
+
+
+def export_event_stream(song, path):
+    with open(path, "wb") as f:
+        f.write(encode_event_stream(song))
+
+
+def load_event_stream(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return decode_event_stream(data, default_name=os.path.splitext(os.path.basename(path))[0])
+
+
+def play_event_stream(path, start_beat=0):
+    """Synthesize an event stream block by block while it plays, never rendering the whole song"""
+    song = load_event_stream(path)
+    song.sequencer.stream_output_and_play(song.duration, song.num_of_loops, start_beat=start_beat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export songs as compact event streams and play them back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a song file as an event stream")
+    export_parser.add_argument("song", help="Song .json or MIDI file")
+    export_parser.add_argument("output", nargs="?", help=f"Output path (default: song name + {EVENT_STREAM_EXTENSION})")
+    play_parser = commands.add_parser("play", help="Play an event stream")
+    play_parser.add_argument("stream")
+    play_parser.add_argument("--start-beat", type=float, default=0)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        song = load_song(args.song)
+        output = args.output or f"{song.name}{EVENT_STREAM_EXTENSION}"
+        export_event_stream(song, output)
+        print(f"Wrote {output} ({os.path.getsize(output)} bytes)")
+    else:
+        play_event_stream(args.stream, start_beat=args.start_beat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import numpy as np
+
+from synth import generate_sine
+
+
+# Samples in one compiled single-cycle table
+TABLE_SIZE = 2048
+# Game Boy 7-bit LFSR noise repeats every 127 steps
+SHORT_NOISE_PERIOD = 127
+WHITE_NOISE_SIZE = 1 << 16
+
+WAVETABLES = {
+    "sine": generate_sine(),
+    "sawtooth": [0, 0.33, 0.66, 1],
+}
+
+
+class Instrument:
+    """Definition of an instrument, referenced from notes by its id in an InstrumentBank
+
+    waveform is "square", "sine", "sawtooth", "noise" or "wavetable" (with
+    `wavetable` holding one cycle of samples). noise_mode is "white" or
+    "short" for the Game Boy's periodic 7-bit noise.
+    """
+
+    def __init__(self, name, waveform="square", wavetable=None, duty_cycle=0.5, attack=0.01, decay=0.1,
+                 sustain_level=1, release=0.1, volume=0.1, noise_mode="white"):
+        self.name = name
+        self.waveform = waveform
+        self.wavetable = wavetable
+        self.duty_cycle = duty_cycle
+        self.attack = attack
+        self.decay = decay
+        self.sustain_level = sustain_level
+        self.release = release
+        self.volume = volume
+        self.noise_mode = noise_mode
+
+    def compile(self, sample_rate=44100):
+        return CompiledInstrument(self, sample_rate)
+
+
+def lfsr_noise(period_bits=7):
+    """One period of the Game Boy noise channel's LFSR output as +-1"""
+    state = (1 << period_bits) - 1
+    out = np.empty((1 << period_bits) - 1, dtype=np.float32)
+    for i in range(len(out)):
+        bit = (state ^ (state >> 1)) & 1
+        state = (state >> 1) | (bit << (period_bits - 1))
+        out[i] = 1.0 if state & 1 else -1.0
+    return out
+
+
+class CompiledInstrument:
+    """Instrument with its cycle table and envelope ramps precomputed for one sample rate"""
+
+    def __init__(self, instrument, sample_rate=44100):
+        self.name = instrument.name
+        self.waveform = instrument.waveform
+        self.duty_cycle = instrument.duty_cycle
+        self.sample_rate = sample_rate
+        self.volume = instrument.volume
+        self.is_noise = instrument.waveform == "noise"
+        self.short_noise = instrument.noise_mode == "short"
+
+        if self.is_noise:
+            if self.short_noise:
+                self.table = lfsr_noise()
+            else:
+                self.table = np.random.default_rng(0).uniform(-1, 1, WHITE_NOISE_SIZE).astype(np.float32)
+        else:
+            self.table = self.compile_table(instrument)
+        # Volume is folded into the table so rendering is one gather and one multiply
+        self.table = self.table * np.float32(self.volume)
+
+        self.sustain_level = instrument.sustain_level
+        self.attack_ramp = np.linspace(0.0, 1.0, int(sample_rate * instrument.attack), dtype=np.float32)
+        self.decay_ramp = np.linspace(1.0, instrument.sustain_level, int(sample_rate * instrument.decay),
+                                      dtype=np.float32)
+        self.release_ramp = np.linspace(instrument.sustain_level, 0.0, int(sample_rate * instrument.release),
+                                        dtype=np.float32)
+
+    @staticmethod
+    def compile_table(instrument):
+        phase = np.arange(TABLE_SIZE) / TABLE_SIZE
+        if instrument.waveform == "square":
+            return np.where(phase < instrument.duty_cycle, 1.0, -1.0).astype(np.float32)
+
+        if instrument.waveform == "wavetable":
+            data = instrument.wavetable
+        elif instrument.waveform in WAVETABLES:
+            data = WAVETABLES[instrument.waveform]
+        else:
+            raise ValueError(f"Unsupported waveform: {instrument.waveform}")
+        # Same normalization and stretch as generate_custom_waveform, done once
+        data = np.array(data, dtype=np.float32)
+        data = data / np.max(np.abs(data))
+        return np.interp(phase * len(data), np.arange(len(data)), data).astype(np.float32)
+
+    def envelope(self, num_samples):
+        """ADSR envelope assembled from the precomputed ramps, like apply_envelope"""
+        env = np.full(num_samples, self.sustain_level, dtype=np.float32)
+        head = np.concatenate((self.attack_ramp, self.decay_ramp))[:num_samples]
+        env[:len(head)] = head
+        release_len = min(len(self.release_ramp), num_samples)
+        if release_len:
+            env[num_samples - release_len:] = self.release_ramp[len(self.release_ramp) - release_len:]
+        return env
+
+    def render(self, frequency, num_samples, duty_cycle=None):
+        """Render a note; frequency may be a per-sample curve from effects"""
+        if np.ndim(frequency):
+            # Integrate the curve so the phase stays continuous as the pitch moves
+            phase = np.cumsum(frequency / self.sample_rate)
+        else:
+            phase = np.arange(num_samples) * (frequency / self.sample_rate)
+
+        if self.is_noise:
+            if self.short_noise:
+                # The LFSR is clocked at the note frequency
+                wave = self.table[phase.astype(np.int64) % len(self.table)]
+            else:
+                offset = np.random.randint(len(self.table))
+                wave = self.table[(np.arange(num_samples) + offset) % len(self.table)]
+        elif duty_cycle is not None and self.waveform == "square":
+            wave = np.where(phase % 1 < duty_cycle, self.volume, -self.volume).astype(np.float32)
+        else:
+            wave = self.table[((phase % 1) * TABLE_SIZE).astype(np.int64)]
+
+        return wave * self.envelope(num_samples)
+
+
+class InstrumentBank:
+    """Instruments by small integer id, compiled once per sample rate"""
+
+    def __init__(self):
+        self.instruments = []
+        self._compiled = {}
+
+    def add(self, instrument):
+        """Register an instrument and return its id"""
+        self.instruments.append(instrument)
+        return len(self.instruments) - 1
+
+    def find_or_add(self, instrument):
+        """Id of an identical instrument already in the bank, adding it if there is none"""
+        for instrument_id, existing in enumerate(self.instruments):
+            if vars(existing) == vars(instrument):
+                return instrument_id
+        return self.add(instrument)
+
+    def id_of(self, name):
+        for instrument_id, instrument in enumerate(self.instruments):
+            if instrument.name == name:
+                return instrument_id
+        raise KeyError(name)
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def get(self, instrument_id, sample_rate=44100):
+        key = (instrument_id, sample_rate)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self.instruments[instrument_id].compile(sample_rate)
+            self._compiled[key] = compiled
+        return compiled
+
+
+def default_instruments():
+    # Ids 0-3 line up with the phrase grid's original waveform options
+    return [
+        Instrument("square", "square"),
+        Instrument("sine", "sine"),
+        Instrument("sawtooth", "sawtooth"),
+        Instrument("noise", "noise"),
+    ]
+
+
+instrument_bank = InstrumentBank()
+for _instrument in default_instruments():
+    instrument_bank.add(_instrument)
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+FLOAT32_BYTES = np.dtype(np.float32).itemsize
+FLOAT64_BYTES = np.dtype(np.float64).itemsize
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised when a render is projected to use more memory than its budget"""
+
+    def __init__(self, estimated_bytes, budget_bytes):
+        self.estimated_bytes = estimated_bytes
+        self.budget_bytes = budget_bytes
+        super().__init__(
+            f"Render needs an estimated {format_bytes(estimated_bytes)} "
+            f"but the budget is {format_bytes(budget_bytes)}"
+        )
+
+
+class RenderMemoryTracker:
+    """Accounts for the buffers the render pipeline holds, by stage and track"""
+
+    def __init__(self):
+        self.live_bytes = 0
+        self.peak_bytes = 0
+        # (stage, track_name) -> bytes currently held
+        self.live = {}
+        # (stage, track_name) -> largest number of bytes ever held at once
+        self.stage_peaks = {}
+        # Snapshot of self.live at the moment peak_bytes was reached
+        self.peak_breakdown = {}
+
+    def allocate(self, buffer, stage, track=None):
+        """Record a buffer as live and return it unchanged"""
+        key = (stage, track)
+        self.live[key] = self.live.get(key, 0) + buffer.nbytes
+        self.stage_peaks[key] = max(self.stage_peaks.get(key, 0), self.live[key])
+        self.live_bytes += buffer.nbytes
+        if self.live_bytes > self.peak_bytes:
+            self.peak_bytes = self.live_bytes
+            self.peak_breakdown = dict(self.live)
+        return buffer
+
+    def release(self, buffer, stage, track=None):
+        """Record a buffer as no longer referenced by the pipeline"""
+        key = (stage, track)
+        self.live[key] = self.live.get(key, 0) - buffer.nbytes
+        if self.live[key] <= 0:
+            del self.live[key]
+        self.live_bytes -= buffer.nbytes
+
+    def reset(self):
+        self.__init__()
+
+    def report(self):
+        """Format the peak and the per stage/track breakdown as text"""
+        lines = [f"Peak render memory: {format_bytes(self.peak_bytes)}"]
+        for (stage, track), nbytes in sorted(self.stage_peaks.items(), key=lambda item: -item[1]):
+            at_peak = self.peak_breakdown.get((stage, track), 0)
+            label = f"{stage} [{track}]" if track is not None else stage
+            lines.append(f"  {label:<24} peak {format_bytes(nbytes):>10}  at overall peak {format_bytes(at_peak):>10}")
+        return "\n".join(lines)
+
+
+def estimate_render_peak(num_samples, num_of_loops, longest_note_samples, pad_samples=0):
+    """Project the peak bytes of Sequencer.loop_output_and_play before rendering
+
+    Mirrors the buffers that are alive at the same time in each stage of the
+    pipeline and returns (peak_bytes, {stage: bytes}).
+    """
+    phrase = num_samples * FLOAT32_BYTES
+    # Generators return float32, apply_envelope builds a float64 envelope and result
+    note = longest_note_samples * (FLOAT32_BYTES + 2 * FLOAT64_BYTES)
+    looped = num_samples * num_of_loops * FLOAT32_BYTES
+
+    stages = {}
+    # Phrase buffer + the track buffer being rendered + the note being mixed in
+    stages["combine"] = phrase + phrase + note
+    # Original phrase + the previous append result + the new append result
+    if num_of_loops > 1:
+        previous = num_samples * (num_of_loops - 1) * FLOAT32_BYTES if num_of_loops > 2 else 0
+        stages["loop"] = phrase + previous + looped
+    # Looped output + normalized copy + padded copy handed to sounddevice
+    stages["play"] = looped + looped + looped + pad_samples * FLOAT32_BYTES
+    return max(stages.values()), stages
+
+
+def format_bytes(nbytes):
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{nbytes} B"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GiB"
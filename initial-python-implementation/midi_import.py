@@ -0,0 +1,193 @@
+import math
+import os
+import struct
+
+import numpy as np
+
+from notes import NoteEvent
+from phrase_model import NOTE_NAMES
+from sequencer import Track, Sequencer
+from song import Song
+
+
+# MIDI note 12 is C 0, the lowest note in note_frequency_chart
+MIDI_C0 = 12
+DRUM_CHANNEL = 9
+
+# General MIDI program families (program // 8) mapped to the waveform closest in character
+PROGRAM_FAMILY_WAVEFORMS = [
+    "square",    # piano
+    "sine",      # chromatic percussion
+    "sine",      # organ
+    "sawtooth",  # guitar
+    "sawtooth",  # bass
+    "sawtooth",  # strings
+    "sawtooth",  # ensemble
+    "square",    # brass
+    "square",    # reed
+    "sine",      # pipe
+    "square",    # synth lead
+    "sine",      # synth pad
+    "square",    # synth effects
+    "sawtooth",  # ethnic
+    "noise",     # percussive
+    "noise",     # sound effects
+]
+
+
+def read_variable_length(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def iter_chunks(f):
+    """Yield (chunk type, chunk bytes) one chunk at a time from an open SMF file"""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        chunk_type, length = struct.unpack(">4sI", header)
+        yield chunk_type, f.read(length)
+
+
+def parse_track(data):
+    """Pair note-on/note-off events of one MTrk chunk
+
+    Returns the track name, the tempo events as (tick, microseconds per quarter
+    note) and parallel lists of start tick, end tick, MIDI pitch, velocity and
+    waveform for every note.
+    """
+    name = None
+    tempos = []
+    starts, ends, pitches, velocities, waveforms = [], [], [], [], []
+    # (channel, pitch) -> list of (start tick, velocity) still sounding
+    sounding = {}
+    programs = [0] * 16
+
+    pos = 0
+    tick = 0
+    status = 0
+    while pos < len(data):
+        delta, pos = read_variable_length(data, pos)
+        tick += delta
+
+        if data[pos] & 0x80:
+            status = data[pos]
+            pos += 1
+        # Otherwise running status: reuse the previous status byte
+
+        if status == 0xFF:
+            meta_type = data[pos]
+            length, pos = read_variable_length(data, pos + 1)
+            if meta_type == 0x03 and name is None:
+                name = data[pos:pos + length].decode("latin-1").strip()
+            elif meta_type == 0x51:
+                tempos.append((tick, int.from_bytes(data[pos:pos + 3], "big")))
+            elif meta_type == 0x2F:
+                break
+            pos += length
+            continue
+        if status in (0xF0, 0xF7):
+            length, pos = read_variable_length(data, pos)
+            pos += length
+            continue
+
+        kind, channel = status & 0xF0, status & 0x0F
+        if kind in (0xC0, 0xD0):
+            if kind == 0xC0:
+                programs[channel] = data[pos]
+            pos += 1
+            continue
+
+        data1, data2 = data[pos], data[pos + 1]
+        pos += 2
+        if kind == 0x90 and data2 > 0:
+            sounding.setdefault((channel, data1), []).append((tick, data2))
+        elif kind == 0x80 or kind == 0x90:
+            started = sounding.get((channel, data1))
+            if started:
+                start_tick, velocity = started.pop(0)
+                starts.append(start_tick)
+                ends.append(tick)
+                pitches.append(data1)
+                velocities.append(velocity)
+                if channel == DRUM_CHANNEL:
+                    waveforms.append("noise")
+                else:
+                    waveforms.append(PROGRAM_FAMILY_WAVEFORMS[programs[channel] // 8])
+
+    return name, tempos, (starts, ends, pitches, velocities, waveforms)
+
+
+def midi_pitch_to_note_index(pitches):
+    """Map MIDI pitches to NOTE_NAMES indices, folding out of range notes by octaves"""
+    index = np.asarray(pitches, dtype=np.int64) - MIDI_C0
+    index = np.where(index < 0, index % 12, index)
+    highest = len(NOTE_NAMES) - 12
+    return np.where(index >= len(NOTE_NAMES), highest + index % 12, index)
+
+
+def build_track(name, division, notes, volume=0.1):
+    """Build a Track from parsed note lists with one vectorized conversion"""
+    starts, ends, pitches, velocities, waveforms = notes
+    track = Track(name)
+    if not starts:
+        return track
+
+    start_beats = np.asarray(starts, dtype=np.float64) / division
+    duration_beats = (np.asarray(ends, dtype=np.float64) - start_beats * division) / division
+    note_indices = midi_pitch_to_note_index(pitches)
+    volumes = np.asarray(velocities, dtype=np.float64) / 127 * volume
+
+    track.add_notes([
+        NoteEvent(NOTE_NAMES[index], start_beat=start, duration_beats=duration,
+                  volume=note_volume, waveform_type=waveform)
+        for index, start, duration, note_volume, waveform in zip(
+            note_indices.tolist(), start_beats.tolist(), duration_beats.tolist(),
+            volumes.tolist(), waveforms)
+        if duration > 0
+    ])
+    return track
+
+
+def import_midi(path, volume=0.1, sample_rate=44100):
+    """Import a Standard MIDI File as a Song with one Track per MIDI track"""
+    with open(path, "rb") as f:
+        chunks = iter_chunks(f)
+        chunk_type, header = next(chunks, (None, b""))
+        if chunk_type != b"MThd" or len(header) < 6:
+            raise ValueError(f"{path} is not a Standard MIDI File")
+        _, _, division = struct.unpack(">HHH", header[:6])
+        if division & 0x8000:
+            raise ValueError("SMPTE time division is not supported")
+
+        tempos = []
+        tracks = []
+        end_beat = 0.0
+        for chunk_type, data in chunks:
+            if chunk_type != b"MTrk":
+                continue
+            name, track_tempos, notes = parse_track(data)
+            tempos.extend(track_tempos)
+            track = build_track(name or f"track{len(tracks)}", division, notes, volume=volume)
+            if track.notes:
+                tracks.append(track)
+                end_beat = max(end_beat, max(notes[1]) / division)
+
+    # Tempo meta is microseconds per quarter note; later ones become tempo map changes
+    tempos.sort()
+    bpm = 120
+    if tempos and tempos[0][0] == 0:
+        bpm = 60_000_000 / tempos[0][1]
+    changes = [(tick / division, 60_000_000 / tempo) for tick, tempo in tempos if tick > 0]
+    sequencer = Sequencer(bpm=bpm, sample_rate=sample_rate, tempo_changes=changes)
+    for track in tracks:
+        sequencer.add_track(track)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    return Song(name, sequencer, duration=max(math.ceil(end_beat), 1))
@@ -0,0 +1,100 @@
+import numpy as np
+
+from tempo import as_tempo_map
+
+
+class _Node:
+    """Centered interval tree node: the notes sounding at `center`, and the subtrees on either side"""
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, by_start, by_end, left, right):
+        self.center = center
+        # (start, note position) ascending, and (end, note position) descending
+        self.by_start = by_start
+        self.by_end = by_end
+        self.left = left
+        self.right = right
+
+
+def _build(positions, starts, ends):
+    """Tree over the note positions, each spanning [starts[i], ends[i]) with ends[i] > starts[i]"""
+    if not positions:
+        return None
+    center = starts[positions[len(positions) // 2]]
+    here, left, right = [], [], []
+    for i in positions:
+        if ends[i] <= center:
+            left.append(i)
+        elif starts[i] > center:
+            right.append(i)
+        else:
+            here.append(i)
+    return _Node(
+        center,
+        sorted((starts[i], i) for i in here),
+        sorted(((ends[i], i) for i in here), reverse=True),
+        _build(left, starts, ends),
+        _build(right, starts, ends),
+    )
+
+
+class NoteIndex:
+    """Interval index over a track's notes, sorted by start sample
+
+    The notes overlapping [start, end) are the ones starting inside it, a
+    range of the sorted starts, plus the ones already sounding at start,
+    found in a centered interval tree. Each costs O(log n) plus the notes
+    found, however long or overlapping the notes are, so seeking into a long
+    song or rendering one block never visits the whole track.
+    """
+
+    def __init__(self, notes, tempo, sample_rate=44100):
+        tempo_map = as_tempo_map(tempo, sample_rate)
+        start_beats = np.array([note.start_beat for note in notes], dtype=np.float64)
+        end_beats = start_beats + np.array([note.duration_beats for note in notes], dtype=np.float64)
+        # Same positions as NoteEvent.sample_span, looked up for every note at once
+        starts = tempo_map.beats_to_samples(start_beats)
+        ends = tempo_map.beats_to_samples(end_beats)
+
+        order = np.argsort(starts, kind="stable")
+        self.notes = [notes[i] for i in order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        # Zero length notes never sound at a point, they are only found by their start
+        starts_list = self.starts.tolist()
+        ends_list = self.ends.tolist()
+        self._tree = _build([i for i in range(len(notes)) if ends_list[i] > starts_list[i]], starts_list, ends_list)
+
+    def __len__(self):
+        return len(self.notes)
+
+    def sounding_at(self, index):
+        """Positions of the notes with start <= index < end, in no particular order"""
+        found = []
+        node = self._tree
+        while node is not None:
+            if index < node.center:
+                # Every note here ends after center, so it sounds at index if it has started
+                for start, i in node.by_start:
+                    if start > index:
+                        break
+                    found.append(i)
+                node = node.left
+            else:
+                # Every note here started by center, so it sounds at index if it hasn't ended
+                for end, i in node.by_end:
+                    if end <= index:
+                        break
+                    found.append(i)
+                node = node.right
+        return found
+
+    def overlapping(self, start_index, end_index):
+        """Notes sounding anywhere in the samples [start_index, end_index), in start order"""
+        lo = int(np.searchsorted(self.starts, start_index, side="right"))
+        hi = int(np.searchsorted(self.starts, end_index, side="left"))
+        # Notes sounding at start_index all start before lo
+        hits = sorted(self.sounding_at(start_index)) if end_index > start_index else []
+        hits.extend(range(lo, hi))
+        return [self.notes[i] for i in hits]
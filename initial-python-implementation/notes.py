@@ -1,20 +1,39 @@
 from synth import *
+from effects import effect_curves, normalize_effects
+from instruments import instrument_bank
+from tempo import as_tempo_map
 
 
 class NoteEvent:
-    def __init__(self, note, start_beat, duration_beats, volume=0.1, waveform_type='square'):
+    def __init__(self, note, start_beat, duration_beats, volume=0.1, waveform_type='square', effects=(),
+                 instrument=None):
         self.note = note
         self.frequency = note_frequency_chart[note]
         self.start_beat = start_beat
         self.duration_beats = duration_beats
         self.volume = volume
         self.waveform_type = waveform_type
+        # (command, param) pairs, see effects.py
+        self.effects = normalize_effects(effects)
+        # Id in instruments.instrument_bank; when set it replaces waveform_type,
+        # volume and the default envelope
+        self.instrument = instrument
 
-    def render(self, bpm, sample_rate=44100):
-        start_time = self.start_beat * (60 / bpm)
-        duration = self.duration_beats * (60 / bpm)
+    def render(self, tempo, sample_rate=44100):
+        """Render the note; tempo is a TempoMap or a constant bpm"""
+        tempo_map = as_tempo_map(tempo, sample_rate)
+        start_index, num_samples = self.sample_span(tempo_map, sample_rate)
+        start_time = start_index / sample_rate
+        # Half a sample of headroom so int(sample_rate * duration) gives back exactly num_samples
+        duration = (num_samples + 0.5) / sample_rate
+        # Effects tick at the tempo in force when the note starts
+        bpm = tempo_map.bpm_at(self.start_beat)
 
-        if self.waveform_type == 'square':
+        if self.instrument is not None:
+            return start_time, self.render_instrument(bpm, num_samples, sample_rate)
+        if self.effects:
+            wave = self.render_with_effects(bpm, num_samples, sample_rate)
+        elif self.waveform_type == 'square':
             wave = generate_square_wave(self.frequency, duration, sample_rate, volume=self.volume)
         elif self.waveform_type == 'sine':
             wave = generate_custom_waveform(generate_sine(), self.frequency, duration, sample_rate, volume=self.volume)
@@ -28,6 +47,54 @@ class NoteEvent:
         wave = apply_envelope(wave)
         return start_time, wave
 
+    def render_instrument(self, bpm, num_samples, sample_rate=44100):
+        # Compiled once per instrument, so per-note setup is just this lookup
+        compiled = instrument_bank.get(self.instrument, sample_rate)
+        if not self.effects:
+            return compiled.render(self.frequency, num_samples)
+
+        frequencies, amplitude, duty_cycle = effect_curves(self.effects, self.frequency, num_samples, bpm, sample_rate)
+        has_duty_effect = any(command == 'W' for command, _ in self.effects)
+        wave = compiled.render(frequencies, num_samples, duty_cycle=duty_cycle if has_duty_effect else None)
+        if amplitude is not None:
+            wave = wave * amplitude
+        return wave
+
+    def render_with_effects(self, bpm, num_samples, sample_rate=44100):
+        frequencies, amplitude, duty_cycle = effect_curves(self.effects, self.frequency, num_samples, bpm, sample_rate)
+
+        if self.waveform_type == 'square':
+            wave = generate_swept_square_wave(frequencies, sample_rate, duty_cycle, volume=self.volume)
+        elif self.waveform_type == 'sine':
+            wave = generate_swept_waveform(generate_sine(), frequencies, sample_rate, volume=self.volume)
+        elif self.waveform_type == 'sawtooth':
+            wave = generate_swept_waveform([0, 0.33, 0.66, 1], frequencies, sample_rate, volume=self.volume)
+        elif self.waveform_type == 'noise':
+            wave = generate_noise((num_samples + 0.5) / sample_rate, sample_rate, volume=self.volume)
+        else:
+            raise ValueError("Unsupported waveform")
+
+        if amplitude is not None:
+            wave = wave * amplitude
+        return wave
+
+    def sample_span(self, tempo, sample_rate=44100):
+        """Exact start index and length of the note in samples, without rendering it"""
+        tempo_map = as_tempo_map(tempo, sample_rate)
+        start_index = tempo_map.beat_to_sample(self.start_beat)
+        end_index = tempo_map.beat_to_sample(self.start_beat + self.duration_beats)
+        return start_index, end_index - start_index
+
+
+    def wave_key(self, tempo, sample_rate=44100):
+        """Everything the rendered wave depends on, except where the note starts"""
+        tempo_map = as_tempo_map(tempo, sample_rate)
+        num_samples = self.sample_span(tempo_map, sample_rate)[1]
+        # Only effects depend on the tempo beyond the note length
+        bpm = tempo_map.bpm_at(self.start_beat) if self.effects else None
+        return (self.note, num_samples, self.volume, self.waveform_type, self.effects, self.instrument, bpm,
+                sample_rate)
+
 
     def copy_with_offset_beats(self, beat_offset):
         return NoteEvent(
@@ -35,7 +102,9 @@ class NoteEvent:
             start_beat=self.start_beat + beat_offset,
             duration_beats=self.duration_beats,
             volume=self.volume,
-            waveform_type=self.waveform_type
+            waveform_type=self.waveform_type,
+            effects=self.effects,
+            instrument=self.instrument
         )
 
 
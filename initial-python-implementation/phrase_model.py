@@ -0,0 +1,193 @@
+import math
+
+import numpy as np
+
+from effects import EFFECT_COMMANDS, parse_effect, format_effect
+from instruments import instrument_bank
+from notes import NoteEvent, note_frequency_chart
+from sequencer import Track
+
+
+# Pitch is stored as an index into NOTE_NAMES (C 0 .. B 8, chromatic order)
+NOTE_NAMES = list(note_frequency_chart)
+REST = -1
+DEFAULT_PITCH = NOTE_NAMES.index("C 4")
+
+# Duration options (in 4:4 time signature) and their length in beats (1 beat = quarter note)
+DURATION_OPTIONS = ["1/32", "1/16", "1/8", "1/4", "1/2", "1"]
+DURATION_BEATS = np.array([0.125, 0.25, 0.5, 1.0, 2.0, 4.0])
+DEFAULT_DURATION = DURATION_OPTIONS.index("1/16")
+
+# Instruments are ids into instruments.instrument_bank
+DEFAULT_INSTRUMENT = 0
+
+# Effect command is an index into EFFECT_COMMANDS, NO_EFFECT for an empty cell
+NO_EFFECT = -1
+
+NOTE_COLUMN, DURATION_COLUMN, INSTRUMENT_COLUMN, FX_COLUMN = 0, 1, 2, 3
+
+
+class PhraseModel:
+    """Array-backed phrase: one pitch, duration, instrument and effect per row
+
+    This is the source of truth for a phrase. Views read cell text from it and
+    call take_dirty() to learn which cells changed since they last redrew.
+    """
+
+    COLUMNS = ("Note", "Duration", "Instr", "FX")
+    # Each row is a 16th note
+    ROW_BEATS = 0.25
+
+    def __init__(self, num_rows=15):
+        self.pitch = np.full(num_rows, REST, dtype=np.int16)
+        self.duration = np.full(num_rows, DEFAULT_DURATION, dtype=np.int8)
+        self.instrument = np.full(num_rows, DEFAULT_INSTRUMENT, dtype=np.uint8)
+        self.effect = np.full(num_rows, NO_EFFECT, dtype=np.int8)
+        self.effect_param = np.zeros(num_rows, dtype=np.uint8)
+        self.dirty = set()
+
+    @property
+    def num_rows(self):
+        return len(self.pitch)
+
+    @property
+    def length_beats(self):
+        """Length of the phrase rounded up to whole 4/4 measures"""
+        return math.ceil(self.num_rows * self.ROW_BEATS / 4) * 4
+
+    def _columns(self):
+        return (self.pitch, self.duration, self.instrument, self.effect)
+
+    def cell_text(self, row, column):
+        if column == NOTE_COLUMN:
+            pitch = self.pitch[row]
+            return "----" if pitch == REST else NOTE_NAMES[pitch]
+        if column == DURATION_COLUMN:
+            return DURATION_OPTIONS[self.duration[row]]
+        if column == FX_COLUMN:
+            effect = self.effect[row]
+            return "---" if effect == NO_EFFECT else format_effect(EFFECT_COMMANDS[effect], self.effect_param[row])
+        # Padded so the column is wide enough for the built-in names
+        return f"{instrument_bank.instruments[self.instrument[row]].name:<8}"
+
+    def row_text(self, row):
+        return [self.cell_text(row, column) for column in range(len(self.COLUMNS))]
+
+    def set_cell(self, row, column, value):
+        array = self._columns()[column]
+        if array[row] != value:
+            array[row] = value
+            self.dirty.add((row, column))
+
+    def set_effect_param(self, row, param):
+        if self.effect_param[row] != param:
+            self.effect_param[row] = param
+            self.dirty.add((row, FX_COLUMN))
+
+    def clear_cell(self, row, column):
+        default = (REST, DEFAULT_DURATION, DEFAULT_INSTRUMENT, NO_EFFECT)[column]
+        self.set_cell(row, column, default)
+        if column == FX_COLUMN:
+            self.set_effect_param(row, 0)
+
+    def set_cell_text(self, row, column, text):
+        """Set a cell from typed text, returning False if the text isn't a valid value"""
+        text = text.strip()
+        if column == NOTE_COLUMN:
+            if text in ("", "----"):
+                value = REST
+            elif text in note_frequency_chart:
+                value = NOTE_NAMES.index(text)
+            else:
+                return False
+        elif column == FX_COLUMN:
+            if text in ("", "---"):
+                self.clear_cell(row, column)
+                return True
+            try:
+                command, param = parse_effect(text)
+            except ValueError:
+                return False
+            self.set_cell(row, column, EFFECT_COMMANDS.index(command))
+            self.set_effect_param(row, param)
+            return True
+        elif column == INSTRUMENT_COLUMN:
+            try:
+                value = int(text) if text.isdigit() else instrument_bank.id_of(text)
+            except KeyError:
+                return False
+            if value >= len(instrument_bank):
+                return False
+        else:
+            if text not in DURATION_OPTIONS:
+                return False
+            value = DURATION_OPTIONS.index(text)
+        self.set_cell(row, column, value)
+        return True
+
+    def step_cell(self, row, column, direction=1):
+        """Move a cell to the next (1) or previous (-1) value"""
+        if column == NOTE_COLUMN:
+            pitch = self.pitch[row]
+            if pitch == REST:
+                new_value = DEFAULT_PITCH
+            else:
+                new_value = min(max(pitch + direction, 0), len(NOTE_NAMES) - 1)
+        elif column == FX_COLUMN:
+            # Cycle through "no effect" and every command
+            new_value = (int(self.effect[row]) + 1 + direction) % (len(EFFECT_COMMANDS) + 1) - 1
+        else:
+            array = self._columns()[column]
+            num_options = len(DURATION_OPTIONS) if column == DURATION_COLUMN else len(instrument_bank)
+            new_value = (int(array[row]) + direction) % num_options
+        self.set_cell(row, column, new_value)
+
+    def step_octave(self, row, direction=1):
+        pitch = self.pitch[row]
+        if pitch == REST:
+            new_value = DEFAULT_PITCH
+        else:
+            new_value = pitch + 12 * direction
+            if not 0 <= new_value < len(NOTE_NAMES):
+                new_value = pitch
+        self.set_cell(row, NOTE_COLUMN, new_value)
+
+    def step_effect_param(self, row, direction=1):
+        if self.effect[row] != NO_EFFECT:
+            self.set_effect_param(row, (int(self.effect_param[row]) + direction) % 256)
+
+    def note_name(self, row):
+        pitch = self.pitch[row]
+        return None if pitch == REST else NOTE_NAMES[pitch]
+
+    def instrument_waveform(self, row):
+        return instrument_bank.instruments[self.instrument[row]].waveform
+
+    def duration_beats(self, row):
+        return float(DURATION_BEATS[self.duration[row]])
+
+    def take_dirty(self):
+        """Return the cells changed since the last call, and forget them"""
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def to_track(self, name="phrase", volume=0.1):
+        """Build a Track straight from the arrays, skipping rests"""
+        rows = np.flatnonzero(self.pitch != REST)
+        start_beats = rows * self.ROW_BEATS
+        duration_beats = DURATION_BEATS[self.duration[rows]]
+        pitches = self.pitch[rows]
+        instruments = self.instrument[rows]
+        effects = self.effect[rows]
+        effect_params = self.effect_param[rows]
+
+        track = Track(name)
+        track.add_notes(
+            NoteEvent(NOTE_NAMES[pitch], start_beat=start, duration_beats=duration,
+                      volume=volume, instrument=instrument,
+                      effects=() if effect == NO_EFFECT else ((EFFECT_COMMANDS[effect], param),))
+            for pitch, start, duration, instrument, effect, param in zip(
+                pitches.tolist(), start_beats.tolist(), duration_beats.tolist(), instruments.tolist(),
+                effects.tolist(), effect_params.tolist())
+        )
+        return track
@@ -0,0 +1,108 @@
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instruments import instrument_bank
+from sequencer import RenderCancelled
+
+
+def track_instruments(track):
+    """{id: Instrument} for every bank instrument the track's notes refer to"""
+    ids = {note.instrument for note in track.notes if note.instrument is not None}
+    return {instrument_id: instrument_bank.instruments[instrument_id] for instrument_id in ids}
+
+
+def _render_track_into(shm_name, shape, index, track, instruments, tempo_map, sample_rate, start_index):
+    """Worker side: render one track's window into its slice of the shared stem buffer"""
+    # The worker's bank is a copy from when it started, so look the track's
+    # instruments up (or add them) by definition and point the notes at those ids
+    worker_ids = {instrument_id: instrument_bank.find_or_add(instrument)
+                  for instrument_id, instrument in instruments.items()}
+    for note in track.notes:
+        if note.instrument is not None:
+            note.instrument = worker_ids[note.instrument]
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        stems = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        track.render_window(tempo_map, start_index, shape[1], sample_rate, out=stems[index])
+        del stems
+    finally:
+        shm.close()
+
+
+class SharedRenderPool:
+    """Process pool that renders a Sequencer's tracks into shared memory
+
+    Each worker writes its track straight into one slice of a single
+    multiprocessing.shared_memory block, so only the (small) Track objects
+    are pickled and the rendered audio is never copied between processes.
+    The parent only reads the block to mix it, and always unlinks it, even
+    when a worker dies mid-render.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def render(self, sequencer, duration, num_of_loops=1, start_beat=0):
+        """Same output as Sequencer.render, with each track rendered in a worker"""
+        return sequencer.render(duration, num_of_loops, start_beat=start_beat, pool=self)
+
+    def render_block(self, sequencer, start_index, num_samples, out=None, should_stop=None):
+        """Same as Sequencer.render_block, with each track rendered in a worker
+
+        should_stop is polled while waiting for the workers.
+        """
+        if out is None:
+            out = sequencer.output_buffer(num_samples)
+        # Stems are (tracks, samples) for mono, (tracks, samples, channels) for stereo
+        shape = (len(sequencer.tracks),) + out.shape
+        nbytes = max(int(np.prod(shape)) * np.dtype(np.float32).itemsize, 1)
+
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        try:
+            # A fresh block isn't guaranteed to be zeroed everywhere
+            stems = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            stems.fill(0)
+
+            futures = [
+                self.pool.submit(_render_track_into, shm.name, shape, index, track, track_instruments(track),
+                                 sequencer.tempo_map, sequencer.sample_rate, start_index)
+                for index, track in enumerate(sequencer.tracks)
+            ]
+            try:
+                for future in futures:
+                    while should_stop is not None and not future.done():
+                        if should_stop():
+                            for pending in futures:
+                                pending.cancel()
+                            # Workers still writing into the block must finish before it is unlinked
+                            wait(futures)
+                            raise RenderCancelled()
+                        wait([future], timeout=0.05)
+                    future.result()
+            except BrokenProcessPool:
+                # A worker crashed, the pool is unusable so start a new one for next time
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                raise
+
+            for stem in stems:
+                out += stem
+            del stems
+        finally:
+            shm.close()
+            shm.unlink()
+        return out
@@ -0,0 +1,412 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from instruments import instrument_bank
+from notes import NoteEvent
+from sequencer import Track, Sequencer
+from song import song_from_dict
+from synth import write_wav
+
+
+OUTPUT_FORMATS = ("wav", "pcm")
+# Recent requests kept for the latency percentiles in /metrics
+LATENCY_WINDOW = 1000
+
+
+class RenderCache:
+    """Least recently used arrays, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if value.nbytes > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = value
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.nbytes, "hits": self.hits, "misses": self.misses}
+
+
+# Per worker process, kept warm across every request the worker renders
+_note_cache = None
+_stem_cache = None
+
+
+def _start_worker(cache_bytes):
+    """Worker initializer: set up the caches and pay the first-render costs once"""
+    global _note_cache, _stem_cache
+    _note_cache = RenderCache(cache_bytes // 2)
+    _stem_cache = RenderCache(cache_bytes // 2)
+
+    warmup = Sequencer()
+    track = Track("warmup")
+    for beat, waveform in enumerate(["square", "sine", "sawtooth", "noise"]):
+        track.add_note(NoteEvent("C 4", beat, 1, waveform_type=waveform))
+        track.add_note(NoteEvent("C 4", beat, 1, effects=["A37"], waveform_type=waveform))
+    for instrument_id in range(len(instrument_bank)):
+        track.add_note(NoteEvent("C 4", 0, 1, instrument=instrument_id))
+    warmup.add_track(track)
+    warmup.render(4)
+    write_wav(io.BytesIO(), np.zeros(1, dtype=np.float32))
+
+
+def track_key(track):
+    """Everything a track's mono stem depends on besides the tempo and length"""
+    return tuple((note.note, note.start_beat, note.duration_beats, note.volume, note.waveform_type,
+                  note.effects, note.instrument) for note in track.notes)
+
+
+def render_song_cached(song):
+    """Same output as Sequencer.render, reusing the worker's cached stems and note waves"""
+    seq = song.sequencer
+    phrase_len = seq.phrase_samples(song.duration)
+    output = seq.output_buffer(phrase_len * song.num_of_loops)
+    phrase = output[:phrase_len]
+
+    for track in seq.tracks:
+        key = (track_key(track), seq.tempo_map.key, phrase_len)
+        stem = _stem_cache.get(key)
+        if stem is None:
+            stem = track.render_window(seq.tempo_map, 0, phrase_len, seq.sample_rate, note_cache=_note_cache)
+            _stem_cache.put(key, stem)
+        if seq.channels == 1:
+            phrase += stem
+        else:
+            for channel, gain in enumerate(track.pan_gains()):
+                if gain > 0.0:
+                    phrase[:, channel] += stem * gain
+
+    for i in range(1, song.num_of_loops):
+        output[i * phrase_len:(i + 1) * phrase_len] = phrase
+    max_val = np.max(np.abs(output), initial=0.0)
+    if max_val > 1.0:
+        output /= max_val
+    return output
+
+
+def encode_output(output, sample_rate, output_format):
+    if output_format == "wav":
+        buffer = io.BytesIO()
+        write_wav(buffer, output, sample_rate)
+        return buffer.getvalue()
+    # Raw PCM is little-endian float32, interleaved for stereo
+    return output.astype("<f4").tobytes()
+
+
+def _render_batch(jobs):
+    """Worker side: render a batch of (song data, format) jobs, one result dict each
+
+    Errors are caught per job so one bad song doesn't fail the rest of its batch.
+    """
+    results = []
+    for song_data, output_format in jobs:
+        started = time.perf_counter()
+        try:
+            song = song_from_dict(song_data)
+            output = render_song_cached(song)
+            results.append({
+                "ok": True,
+                "body": encode_output(output, song.sequencer.sample_rate, output_format),
+                "sample_rate": song.sequencer.sample_rate,
+                "channels": song.sequencer.channels,
+                "render_seconds": time.perf_counter() - started,
+            })
+        except Exception as e:
+            results.append({"ok": False, "error": f"{type(e).__name__}: {e}",
+                             "render_seconds": time.perf_counter() - started})
+    return results, {"notes": _note_cache.stats(), "stems": _stem_cache.stats()}
+
+
+class RenderRequest:
+    def __init__(self, song_data, output_format):
+        self.song_data = song_data
+        self.output_format = output_format
+        canonical = json.dumps(song_data, sort_keys=True).encode()
+        self.key = (hashlib.sha1(canonical).hexdigest(), output_format)
+        # Requests for the same song go to the same worker, where its stems are cached
+        self.worker = int(self.key[0][:8], 16)
+        self.queued = time.perf_counter()
+        self.future = Future()
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": round(float(p50) * 1000, 2), "p95": round(float(p95) * 1000, 2),
+            "max": round(max(values) * 1000, 2)}
+
+
+class RenderService:
+    """Warm worker processes fed batches of render requests
+
+    A dispatcher thread collects the requests that arrive within batch_window
+    seconds (up to max_batch), renders identical songs only once and hands
+    each worker its share of the batch in a single call. Each worker is its
+    own single-process pool and songs are routed by a hash of their content,
+    so a repeated song always lands on the worker that has it cached while
+    different songs spread over all of them.
+    """
+
+    def __init__(self, workers=None, batch_window=0.01, max_batch=16, cache_bytes=256 * 1024 * 1024):
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_bytes = cache_bytes
+        self.pools = [self._start_pool() for _ in range(workers or os.cpu_count() or 1)]
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # Per pool, the request count of each batch submitted and not finished, oldest
+        # first; a single-process pool runs them in order, so only the first is rendering
+        self.pool_batches = [[] for _ in self.pools]
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.deduplicated = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.render_times = deque(maxlen=LATENCY_WINDOW)
+        self.worker_caches = [None] * len(self.pools)
+
+        self.running = True
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=1, initializer=_start_worker, initargs=(self.cache_bytes,))
+        # Start the process now so the first request doesn't pay for it
+        pool.submit(int)
+        return pool
+
+    def submit(self, song_data, output_format="wav"):
+        """Queue a song definition for rendering, returns a Future of the result dict"""
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        request = RenderRequest(song_data, output_format)
+        self.queue.put(request)
+        return request.future
+
+    def close(self):
+        self.running = False
+        self.queue.put(None)
+        self.dispatcher.join()
+        for pool in self.pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _next_batch(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _dispatch(self):
+        while self.running:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            # Identical songs in one batch are rendered once and share the result
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            by_worker = {}
+            for requests in groups.values():
+                by_worker.setdefault(requests[0].worker % len(self.pools), []).append(requests)
+
+            with self.lock:
+                self.batches += 1
+                self.batched_requests += len(batch)
+                self.deduplicated += len(batch) - len(groups)
+
+            for worker, jobs in by_worker.items():
+                # A list per batch, so _finish removes this batch and not an equal-sized one
+                pending = [sum(len(requests) for requests in jobs)]
+                with self.lock:
+                    self.pool_batches[worker].append(pending)
+                try:
+                    future = self.pools[worker].submit(
+                        _render_batch, [(requests[0].song_data, requests[0].output_format) for requests in jobs])
+                except BrokenProcessPool as e:
+                    # The pool broke after its last batch finished, start a new one for next time
+                    self.pools[worker] = self._start_pool()
+                    future = Future()
+                    future.set_exception(e)
+                future.add_done_callback(
+                    lambda done, worker=worker, jobs=jobs, pending=pending: self._finish(worker, jobs, pending, done))
+
+    def _finish(self, worker, jobs, pending, done):
+        try:
+            results, cache_stats = done.result()
+            self.worker_caches[worker] = cache_stats
+        except BrokenProcessPool as e:
+            # A worker crashed mid-batch, replace it so later requests still have somewhere to go
+            self.pools[worker].shutdown(wait=False, cancel_futures=True)
+            self.pools[worker] = self._start_pool()
+            results = [{"ok": False, "error": f"{type(e).__name__}: {e}", "render_seconds": 0.0}] * len(jobs)
+        except Exception as e:
+            results = [{"ok": False, "error": f"{type(e).__name__}: {e}", "render_seconds": 0.0}] * len(jobs)
+
+        finished = time.perf_counter()
+        with self.lock:
+            for requests, result in zip(jobs, results):
+                self.render_times.append(result["render_seconds"])
+                for request in requests:
+                    self.latencies.append(finished - request.queued)
+                    if result["ok"]:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+            self.pool_batches[worker] = [batch for batch in self.pool_batches[worker] if batch is not pending]
+        for requests, result in zip(jobs, results):
+            for request in requests:
+                request.future.set_result(result)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "workers": len(self.pools),
+                # Requests not rendering yet, whether still batching or queued behind a busy worker
+                "queue_depth": self.queue.qsize() + sum(batch[0] for batches in self.pool_batches
+                                                        for batch in batches[1:]),
+                "rendering": sum(batches[0][0] for batches in self.pool_batches if batches),
+                "pool_pending": [sum(batch[0] for batch in batches) for batches in self.pool_batches],
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+                "deduplicated": self.deduplicated,
+                "latency_ms": percentiles(list(self.latencies)),
+                "render_ms": percentiles(list(self.render_times)),
+                "worker_caches": list(self.worker_caches),
+            }
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """POST /render?format=wav|pcm with a song JSON body, GET /metrics"""
+
+    service = None
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/metrics":
+            self.send_error(404)
+            return
+        self.send_body(200, json.dumps(self.service.metrics()).encode(), "application/json")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/render":
+            self.send_error(404)
+            return
+        output_format = parse_qs(url.query).get("format", ["wav"])[0]
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            song_data = json.loads(self.rfile.read(length))
+            if not isinstance(song_data, dict):
+                raise ValueError("song definition must be a JSON object")
+            future = self.service.submit(song_data, output_format)
+        except ValueError as e:
+            self.send_body(400, f"{e}\n".encode(), "text/plain")
+            return
+
+        result = future.result()
+        if not result["ok"]:
+            self.send_body(400, f"{result['error']}\n".encode(), "text/plain")
+            return
+        content_type = "audio/wav" if output_format == "wav" else "application/octet-stream"
+        self.send_body(200, result["body"], content_type, {
+            "X-Sample-Rate": result["sample_rate"],
+            "X-Channels": result["channels"],
+            "X-Render-Seconds": f"{result['render_seconds']:.4f}",
+        })
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Per-request lines would drown the terminal, /metrics has the numbers
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, **service_options):
+    service = RenderService(**service_options)
+    handler = type("Handler", (RenderRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Rendering on http://{host}:{port}/render, metrics at /metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render song definitions on demand over localhost HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument("--batch-window", type=float, default=10.0,
+                        help="Milliseconds to wait for more requests to batch together")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--cache-mb", type=int, default=256, help="Note and stem cache size per worker")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, workers=args.workers, batch_window=args.batch_window / 1000,
+          max_batch=args.max_batch, cache_bytes=args.cache_mb * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    main()
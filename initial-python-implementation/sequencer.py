@@ -1,92 +1,407 @@
 from synth import *
 from notes import *
+from memory import RenderMemoryTracker, MemoryBudgetExceeded, estimate_render_peak
+from note_index import NoteIndex
+from tempo import TempoMap, as_tempo_map
+from functools import partial
 import numpy as np
 
+
+class RenderCancelled(Exception):
+    """Raised inside a render when its should_stop callback returns True"""
+
+
 class Track:
-    def __init__(self, name):
+    def __init__(self, name, pan=0.0):
         self.notes = []
         self.name = name
+        # -1.0 is hard left, 1.0 hard right; the ends match the Game Boy's per-channel routing
+        self.pan = pan
+        # NoteIndex for the current notes, rebuilt lazily after they change
+        self._index = None
 
     def add_note(self, note_event):
         self.notes.append(note_event)
+        self._index = None
+
+    def add_notes(self, note_events):
+        self.notes.extend(note_events)
+        self._index = None
+
+    def pan_gains(self):
+        """(left, right) gain for a stereo mix"""
+        return min(1.0, 1.0 - self.pan), min(1.0, 1.0 + self.pan)
+
+    def note_index(self, tempo, sample_rate=44100):
+        tempo_map = as_tempo_map(tempo, sample_rate)
+        key = (tempo_map.key, sample_rate)
+        if self._index is None or self._index[0] != key:
+            self._index = (key, NoteIndex(self.notes, tempo_map, sample_rate))
+        return self._index[1]
+
+    def render(self, tempo, total_duration, sample_rate=44100, memory_tracker=None):
+        return self.render_window(tempo, 0, int(sample_rate * total_duration), sample_rate,
+                                  memory_tracker=memory_tracker)
+
+    def render_window(self, tempo, start_index, num_samples, sample_rate=44100, out=None, memory_tracker=None,
+                      should_stop=None, note_cache=None, sounding=None):
+        """Render only the samples [start_index, start_index + num_samples)
 
-    def render(self, bpm, total_duration, sample_rate=44100):
-        final_wave = np.zeros(int(sample_rate * total_duration), dtype=np.float32)
+        `tempo` is a TempoMap or a constant bpm.
+        Mixes into `out` when given instead of allocating a buffer for the track.
+        A 2D (samples, 2) `out` is an interleaved stereo bus, and each note is
+        added into its left and right strided views with the track's pan gains.
+        `should_stop` is polled before each note so a stale render can be abandoned.
+        `note_cache` (anything with get/put) reuses waves of notes rendered before.
+        `sounding` is a dict owned by a streaming caller: it keeps the waves of
+        notes that run past this window, so the next window doesn't synthesize
+        them again.
+        """
+        if out is None:
+            out = np.zeros(num_samples, dtype=np.float32)
+            if memory_tracker is not None:
+                memory_tracker.allocate(out, "track", self.name)
+        end_window = start_index + num_samples
+        tempo_map = as_tempo_map(tempo, sample_rate)
+        gains = self.pan_gains() if out.ndim == 2 else None
 
-        for note in self.notes:
-            start_time, wave = note.render(bpm, sample_rate)
-            start_index = int(start_time * sample_rate)
-            end_index = start_index + len(wave)
+        notes = self.note_index(tempo_map, sample_rate).overlapping(start_index, end_window)
+        if sounding:
+            # Forget notes that ended before this window, or that it no longer overlaps after a wrap
+            overlapping = set(notes)
+            for note in [note for note in sounding if note not in overlapping]:
+                del sounding[note]
+
+        for note in notes:
+            note_start, note_len = note.sample_span(tempo_map, sample_rate)
+            if should_stop is not None and should_stop():
+                raise RenderCancelled()
+
+            wave = sounding.get(note) if sounding else None
+            if wave is None and note_cache is not None:
+                wave_key = note.wave_key(tempo_map, sample_rate)
+                wave = note_cache.get(wave_key)
+            if wave is None:
+                _, wave = note.render(tempo_map, sample_rate)
+                if note_cache is not None:
+                    note_cache.put(wave_key, wave)
+            if sounding is not None and note_start + note_len > end_window:
+                # The next window needs the rest of this note
+                sounding[note] = wave
+            if memory_tracker is not None:
+                memory_tracker.allocate(wave, "note", self.name)
+
+            # Clip the note to the window
+            wave_from = max(start_index - note_start, 0)
+            wave_to = min(len(wave), end_window - note_start)
+            if wave_to > wave_from:
+                out_from = note_start + wave_from - start_index
+                out_to = out_from + wave_to - wave_from
+                if gains is None:
+                    out[out_from:out_to] += wave[wave_from:wave_to]
+                else:
+                    for channel, gain in enumerate(gains):
+                        if gain == 1.0:
+                            out[out_from:out_to, channel] += wave[wave_from:wave_to]
+                        elif gain > 0.0:
+                            out[out_from:out_to, channel] += wave[wave_from:wave_to] * gain
+
+            if memory_tracker is not None:
+                memory_tracker.release(wave, "note", self.name)
+        return out
+
+    def longest_note_samples(self, tempo, sample_rate=44100):
+        return max((note.sample_span(tempo, sample_rate)[1] for note in self.notes), default=0)
 
-            if end_index > len(final_wave):
-                end_index = len(final_wave)
-                wave = wave[:end_index - start_index]
-            final_wave[start_index:end_index] += wave
-        return final_wave
-    
     def loop_track(self, num_of_loops, phrase_duration_beats):
         original_notes = self.notes.copy()
-        for i in range(1, num_of_loops): 
+        for i in range(1, num_of_loops):
             beat_offset = i * phrase_duration_beats
             for note in original_notes:
                 new_note = note.copy_with_offset_beats(beat_offset)
                 self.notes.append(new_note)
+        self._index = None
 
 
 
 class Sequencer:
-    def __init__(self, bpm=120, sample_rate=44100):
-        self.bpm = bpm
+    # Samples of silence appended in play() so stopping playback isn't so harsh
+    TAIL_SECONDS = 0.2
+
+    def __init__(self, bpm=120, sample_rate=44100, memory_budget=None, over_budget="stream",
+                 memory_tracker=None, block_size=4096, channels=1, tempo_changes=()):
         self.tracks = []
         self.sample_rate = sample_rate
+        # Exact sample position of every tick, shared by rendering, streaming and playback cursors
+        self.tempo_map = TempoMap(bpm, tempo_changes, sample_rate)
+        # Starting tempo, which a tempo change at beat 0 overrides
+        self.bpm = self.tempo_map.bpm
+        # 1 for mono, 2 for a stereo mix bus using each track's pan
+        self.channels = channels
+        # Bytes the offline render may use; None disables the pre-flight check
+        self.memory_budget = memory_budget
+        # What to do when the estimate exceeds the budget: "stream" or "refuse"
+        self.over_budget = over_budget
+        # Set to a RenderMemoryTracker to account for every buffer rendered
+        self.memory_tracker = memory_tracker
+        self.block_size = block_size
 
     def add_track(self, track):
         self.tracks.append(track)
 
 
+    def enable_memory_tracking(self):
+        self.memory_tracker = RenderMemoryTracker()
+        return self.memory_tracker
+
+
+    def _allocated(self, buffer, stage):
+        if self.memory_tracker is not None:
+            self.memory_tracker.allocate(buffer, stage)
+        return buffer
+
+
+    def _released(self, buffer, stage):
+        if self.memory_tracker is not None:
+            self.memory_tracker.release(buffer, stage)
+
+
+    def phrase_samples(self, phrase_duration):
+        return self.tempo_map.beat_to_sample(phrase_duration)
+
+
+    def output_buffer(self, num_samples):
+        """Zeroed mix bus: flat for mono, interleaved (samples, channels) otherwise"""
+        shape = num_samples if self.channels == 1 else (num_samples, self.channels)
+        return np.zeros(shape, dtype=np.float32)
+
+
+    def estimate_peak_bytes(self, duration, num_of_loops=1):
+        """Projected peak bytes of loop_output_and_play, as (peak, {stage: bytes})"""
+        longest_note = max((track.longest_note_samples(self.tempo_map, self.sample_rate) for track in self.tracks), default=0)
+        return estimate_render_peak(
+            self.phrase_samples(duration) * self.channels,
+            num_of_loops,
+            longest_note,
+            pad_samples=int(self.TAIL_SECONDS * self.sample_rate) * self.channels,
+        )
+
+
+    def fits_memory_budget(self, duration, num_of_loops=1):
+        """Check the budget, returning False to stream or raising when set to refuse"""
+        if self.memory_budget is None:
+            return True
+        estimate, _ = self.estimate_peak_bytes(duration, num_of_loops)
+        if estimate <= self.memory_budget:
+            return True
+        if self.over_budget == "refuse":
+            raise MemoryBudgetExceeded(estimate, self.memory_budget)
+        return False
+
+
     def setup_phrase_length(self, phrase_duration):
-        total_duration = phrase_duration * (60 / self.bpm) 
-        final_output = np.zeros(int(self.sample_rate * total_duration), dtype=np.float32)
-        return final_output
+        final_output = self.output_buffer(self.phrase_samples(phrase_duration))
+        return self._allocated(final_output, "phrase")
+
 
-    
     def combine_tracks(self, total_duration, final_output):
-        total_duration = total_duration * (60 / self.bpm)
         combined = final_output
         for track in self.tracks:
-            combined += track.render(self.bpm, total_duration, self.sample_rate)
+            if self.channels > 1:
+                # Panned straight into the stereo bus, no per-track buffer
+                track.render_window(self.tempo_map, 0, len(combined), self.sample_rate, out=combined,
+                                    memory_tracker=self.memory_tracker)
+                continue
+            track_output = track.render_window(self.tempo_map, 0, len(combined), self.sample_rate,
+                                               memory_tracker=self.memory_tracker)
+            combined += track_output
+            if self.memory_tracker is not None:
+                self.memory_tracker.release(track_output, "track", track.name)
         return combined
 
 
-    def loop_output_and_play(self, duration, num_of_loops):  
+    def loop_output_and_play(self, duration, num_of_loops):
+        if not self.fits_memory_budget(duration, num_of_loops):
+            self.stream_output_and_play(duration, num_of_loops)
+            return
+
         blank_output = self.setup_phrase_length(duration)
         combined_output = self.combine_tracks(duration, blank_output)
 
         original_combined_output = combined_output
         for i in range(1, num_of_loops):
             # Duplicating the np array to loop the track
-            combined_output = np.append(combined_output, original_combined_output)
+            previous_output = combined_output
+            combined_output = self._allocated(np.concatenate((combined_output, original_combined_output)), "loop")
+            if previous_output is not original_combined_output:
+                self._released(previous_output, "loop")
 
         self.play(combined_output)
+        # Done with every buffer, so a tracker reused for the next render starts from zero live bytes
+        if combined_output is not original_combined_output:
+            self._released(combined_output, "loop")
+        self._released(original_combined_output, "phrase")
 
 
     def normalize_output(self, final_output):
         max_val = np.max(np.abs(final_output))
         if max_val > 1.0:
-            final_output = final_output / max_val
+            final_output = self._allocated(final_output / max_val, "normalize")
         return final_output
 
 
-    def play(self, output):
-        output = self.normalize_output(output)
-        # Adding a buffer of 0.2 * sample_rate so stopping playback isn't so harsh
-        extended_output = np.append(output, np.zeros(int(0.2 * self.sample_rate), dtype=np.float32))
+    def play(self, output, blocking=True):
+        normalized = self.normalize_output(output)
+        extended_output = np.concatenate((normalized, self.output_buffer(int(self.TAIL_SECONDS * self.sample_rate))))
+        self._allocated(extended_output, "play")
         sd.play(extended_output, self.sample_rate)
-        sd.wait()
+        if blocking:
+            sd.wait()
+        # Once handed to sounddevice the pipeline no longer holds these
+        self._released(extended_output, "play")
+        if normalized is not output:
+            self._released(normalized, "normalize")
+
+
+    def start_playback(self, output, tap=None):
+        """Play a rendered buffer from a callback stream and return without waiting
+
+        `tap` is called from the audio callback with every block that is sent
+        to the device, so it must never block.
+        """
+        output = self.normalize_output(output)
+        position = 0
+
+        def callback(outdata, frames, time_info, status):
+            nonlocal position
+            chunk = output[position:position + frames]
+            n = len(chunk)
+            outdata[:n] = chunk.reshape(n, self.channels)
+            outdata[n:] = 0
+            if tap is not None:
+                tap(chunk)
+            position += n
+            if n < frames:
+                raise sd.CallbackStop()
+
+        stream = sd.OutputStream(samplerate=self.sample_rate, channels=self.channels, dtype="float32",
+                                 callback=callback)
+        stream.start()
+        return stream
+
 
-    
     def play_once(self, duration):
+        if not self.fits_memory_budget(duration):
+            self.stream_output_and_play(duration, 1)
+            return
+
         blank_output = self.setup_phrase_length(duration)
         combined_output = self.combine_tracks(duration, blank_output)
         self.play(combined_output)
+        self._released(combined_output, "phrase")
+
+
+    def render(self, duration, num_of_loops=1, should_stop=None, start_beat=0, pool=None):
+        """Render the looped output into one preallocated, normalized buffer
+
+        With start_beat the output begins part way into the first loop.
+        With a render_pool.SharedRenderPool the tracks are rendered in its workers.
+        The whole song is held at once, so over the memory budget it is refused
+        even when over_budget is "stream".
+        """
+        if not 0 <= start_beat <= duration:
+            raise ValueError(f"start_beat {start_beat} is outside the {duration} beat phrase")
+        if not self.fits_memory_budget(duration, num_of_loops):
+            estimate, _ = self.estimate_peak_bytes(duration, num_of_loops)
+            raise MemoryBudgetExceeded(estimate, self.memory_budget)
+        phrase_len = self.phrase_samples(duration)
+        start_index = self.phrase_samples(start_beat)
+        first = phrase_len - start_index
+        output = self._allocated(self.output_buffer(first + phrase_len * (num_of_loops - 1)), "render")
+        render_block = self.render_block if pool is None else partial(pool.render_block, self)
+        if num_of_loops > 1:
+            # Mix the phrase straight into the first full loop, then copy it everywhere else
+            phrase = render_block(0, phrase_len, out=output[first:first + phrase_len], should_stop=should_stop)
+            output[:first] = phrase[start_index:]
+            for i in range(2, num_of_loops):
+                offset = first + (i - 1) * phrase_len
+                output[offset:offset + phrase_len] = phrase
+        else:
+            # Only the notes overlapping [start_index, phrase_len) are rendered
+            render_block(start_index, first, out=output, should_stop=should_stop)
+        max_val = np.max(np.abs(output), initial=0.0)
+        if max_val > 1.0:
+            output /= max_val
+        # Handed to the caller, the pipeline no longer holds it
+        self._released(output, "render")
+        return output
+
+
+    def render_stems(self, duration, num_of_loops=1):
+        """Render each track on its own (mono, before panning), as (track name, buffer) in track order"""
+        stems = []
+        for track in self.tracks:
+            phrase = track.render_window(self.tempo_map, 0, self.phrase_samples(duration), self.sample_rate)
+            stems.append((track.name, np.tile(phrase, num_of_loops)))
+        return stems
+
+
+    def render_block(self, start_index, num_samples, out=None, should_stop=None, sounding=None):
+        """Mix all tracks for samples [start_index, start_index + num_samples) into one block
+
+        `sounding` ({track: {note: wave}}) carries notes still sounding from one
+        block to the next, see Track.render_window.
+        """
+        if out is None:
+            out = self.output_buffer(num_samples)
+        for track in self.tracks:
+            track.render_window(self.tempo_map, start_index, num_samples, self.sample_rate, out=out,
+                                memory_tracker=self.memory_tracker, should_stop=should_stop,
+                                sounding=None if sounding is None else sounding.setdefault(track, {}))
+        return out
+
+
+    def iter_blocks(self, duration, num_of_loops=1, start_beat=0):
+        """Yield the looped output block by block without holding the whole song
+
+        Only one block of block_size samples is alive at a time, so peak memory
+        no longer grows with the song length. Each block only touches the notes
+        overlapping it, so starting at start_beat costs nothing extra.
+        """
+        phrase_len = self.phrase_samples(duration)
+        total = phrase_len * num_of_loops
+        block = self.output_buffer(self.block_size)
+        position = self.phrase_samples(start_beat)
+        # Waves of notes still sounding, so each note is synthesized once per run
+        sounding = {}
+        while position < total:
+            num_samples = min(self.block_size, total - position)
+            out = block[:num_samples]
+            out.fill(0)
+            # A block may straddle the end of the phrase (several times over when it is
+            # longer than the phrase), render each piece separately
+            filled = 0
+            while filled < num_samples:
+                phrase_pos = (position + filled) % phrase_len
+                piece = min(num_samples - filled, phrase_len - phrase_pos)
+                self.render_block(phrase_pos, piece, out=out[filled:filled + piece], sounding=sounding)
+                filled += piece
+            yield out
+            position += num_samples
+
+
+    def play_from(self, start_beat, duration, num_of_loops=1):
+        if not self.fits_memory_budget(duration, num_of_loops):
+            self.stream_output_and_play(duration, num_of_loops, start_beat=start_beat)
+            return
+        self.play(self.render(duration, num_of_loops, start_beat=start_beat))
+
+
+    def stream_output_and_play(self, duration, num_of_loops=1, start_beat=0):
+        # The peak is unknown ahead of time when streaming, so clip instead of normalizing
+        with sd.OutputStream(samplerate=self.sample_rate, channels=self.channels, dtype="float32") as stream:
+            for block in self.iter_blocks(duration, num_of_loops, start_beat=start_beat):
+                np.clip(block, -1.0, 1.0, out=block)
+                stream.write(block)
+            stream.write(self.output_buffer(int(self.TAIL_SECONDS * self.sample_rate)))
 
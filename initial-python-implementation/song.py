@@ -0,0 +1,111 @@
+import json
+import os
+
+from instruments import Instrument, instrument_bank
+from notes import NoteEvent
+from sequencer import Track, Sequencer
+
+
+class Song:
+    """A song definition: a sequencer plus how long and how many times to play it
+
+    Song files are JSON, e.g.
+
+        {
+          "name": "demo",
+          "bpm": 120,
+          "tempo_changes": [[8, 140]],
+          "duration": 12,
+          "num_of_loops": 2,
+          "channels": 2,
+          "instruments": [
+            {"name": "bass", "waveform": "square", "duty_cycle": 0.25, "release": 0.05}
+          ],
+          "tracks": [
+            {
+              "name": "bass",
+              "pan": -0.5,
+              "loop": {"num_of_loops": 3, "phrase_duration_beats": 4},
+              "notes": [
+                {"note": "C 2", "start_beat": 0, "duration_beats": 0.5,
+                 "volume": 0.3, "waveform_type": "sawtooth"},
+                {"note": "E 2", "start_beat": 0.5, "duration_beats": 0.5,
+                 "instrument": "bass"}
+              ]
+            }
+          ]
+        }
+    """
+
+    def __init__(self, name, sequencer, duration, num_of_loops=1):
+        self.name = name
+        self.sequencer = sequencer
+        self.duration = duration
+        self.num_of_loops = num_of_loops
+
+    @property
+    def length_seconds(self):
+        seq = self.sequencer
+        return seq.phrase_samples(self.duration) / seq.sample_rate * self.num_of_loops
+
+
+def song_from_dict(data, default_name="song"):
+    sequencer = Sequencer(bpm=data.get("bpm", 120), sample_rate=data.get("sample_rate", 44100),
+                          channels=data.get("channels", 1), tempo_changes=data.get("tempo_changes", ()))
+
+    # Song instruments are added to the bank, notes refer to them (or built-ins) by name or id.
+    # Loading the same song again reuses its instruments instead of growing the bank.
+    instrument_ids = {instrument.name: i for i, instrument in enumerate(instrument_bank.instruments)}
+    for instrument_data in data.get("instruments", []):
+        instrument_ids[instrument_data["name"]] = instrument_bank.find_or_add(Instrument(**instrument_data))
+
+    for index, track_data in enumerate(data.get("tracks", [])):
+        track = Track(track_data.get("name", f"track{index}"), pan=track_data.get("pan", 0.0))
+        for note_data in track_data.get("notes", []):
+            instrument = note_data.get("instrument")
+            if isinstance(instrument, str):
+                note_data = dict(note_data, instrument=instrument_ids[instrument])
+            track.add_note(NoteEvent(**note_data))
+        loop = track_data.get("loop")
+        if loop:
+            track.loop_track(loop["num_of_loops"], loop["phrase_duration_beats"])
+        sequencer.add_track(track)
+
+    return Song(
+        name=data.get("name", default_name),
+        sequencer=sequencer,
+        duration=data["duration"],
+        num_of_loops=data.get("num_of_loops", 1),
+    )
+
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+EVENT_STREAM_EXTENSIONS = (".cbes",)
+SONG_EXTENSIONS = (".json",) + MIDI_EXTENSIONS + EVENT_STREAM_EXTENSIONS
+
+
+def load_song(path):
+    if path.lower().endswith(MIDI_EXTENSIONS):
+        from midi_import import import_midi
+        return import_midi(path)
+    if path.lower().endswith(EVENT_STREAM_EXTENSIONS):
+        from event_stream import load_event_stream
+        return load_event_stream(path)
+
+    with open(path) as f:
+        data = json.load(f)
+    default_name = os.path.splitext(os.path.basename(path))[0]
+    return song_from_dict(data, default_name=default_name)
+
+
+def find_song_files(paths):
+    """Expand directories into the .json, MIDI and event stream song files they contain"""
+    song_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                if entry.lower().endswith(SONG_EXTENSIONS):
+                    song_files.append(os.path.join(path, entry))
+        else:
+            song_files.append(path)
+    return song_files
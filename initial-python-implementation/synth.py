@@ -37,6 +37,23 @@ def generate_custom_waveform(waveform_data, frequency, duration, sample_rate=441
     return (full_wave * volume).astype(np.float32)
         
 
+def generate_swept_square_wave(frequencies, sample_rate=44100, duty_cycle=0.5, volume=0.1):
+    # Integrating the per-sample frequency keeps the phase continuous as the pitch moves
+    phase = np.cumsum(frequencies / sample_rate) % 1
+    waveform = np.where(phase < duty_cycle, 1.0, -1.0)
+    return (waveform * volume).astype(np.float32)
+
+
+def generate_swept_waveform(waveform_data, frequencies, sample_rate=44100, volume=0.1):
+    # Same single cycle lookup as generate_custom_waveform, driven by a frequency curve
+    waveform_data = np.array(waveform_data, dtype=np.float32)
+    waveform_data = waveform_data / np.max(np.abs(waveform_data))
+
+    phase = np.cumsum(frequencies / sample_rate) % 1
+    full_wave = np.interp(phase * len(waveform_data), np.arange(len(waveform_data)), waveform_data)
+    return (full_wave * volume).astype(np.float32)
+
+
 def generate_sine(data_steps = 120):
     pi = math.pi
     step = pi / data_steps
@@ -48,32 +65,28 @@ def generate_sine(data_steps = 120):
     sin_array.append(0.0)
     return sin_array
 
+def write_wav(path, wave, sample_rate=44100):
+    # 16-bit PCM plays everywhere, float32 WAVs don't
+    clipped = np.clip(wave, -1.0, 1.0)
+    write(path, sample_rate, (clipped * 32767).astype(np.int16))
+
+
 def apply_envelope(wave, attack=0.01, decay=0.1, sustain_level=1, release=0.1, sample_rate=44100):
     length = len(wave)
-    env = np.zeros(length)
+    env = np.full(length, sustain_level, dtype=np.float64)
 
     # Sample lengths
     attack_len = int(sample_rate * attack)
     decay_len = int(sample_rate * decay)
     release_len = int(sample_rate * release)
 
-    sustain_start = attack_len + decay_len
-    sustain_end = length - release_len
-    sustain_len = max(sustain_end - sustain_start, 0)
-
-    if attack_len > 0:
-        env[:attack_len] = np.linspace(0.0, 1.0, attack_len)
-    if decay_len > 0:
-        env[attack_len:sustain_start] = np.linspace(1.0, sustain_level, decay_len)
-    if sustain_len > 0:
-        env[sustain_start:sustain_end] = sustain_level
-    if release_len > 0:
-        env[sustain_end:] = np.linspace(sustain_level, 0.0, release_len)
-
-    if len(env) < length:
-        env = np.pad(env, (0, length - len(env)), 'constant', constant_values=(0,))
-    elif len(env) > length:
-        env = env[:length]
+    # A note shorter than the envelope gets its attack and decay cut off,
+    # and as much of the release as fits, like CompiledInstrument.envelope
+    head = np.concatenate((np.linspace(0.0, 1.0, attack_len), np.linspace(1.0, sustain_level, decay_len)))[:length]
+    env[:len(head)] = head
+    release_fit = min(release_len, length)
+    if release_fit > 0:
+        env[length - release_fit:] = np.linspace(sustain_level, 0.0, release_len)[release_len - release_fit:]
 
     return wave * env
 
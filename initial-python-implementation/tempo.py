@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class TempoMap:
+    """Constant tempo plus tempo-change events, as exact integer sample positions
+
+    The sample position of every tick is computed once, each directly from the
+    start of its tempo segment rather than by adding up rounded note lengths,
+    so note boundaries never drift. Lookups are array indexing, shared by the
+    renderer, the streaming engine and the playback cursor.
+    """
+
+    # Divisible by 32nd notes, triplets and the 24 effect ticks per beat
+    TICKS_PER_BEAT = 96
+    # Ticks precomputed up front; the table doubles when a later beat is asked for
+    INITIAL_TICKS = TICKS_PER_BEAT * 64
+    # The table stops growing here (12 MiB, over two hours at 120 bpm), later
+    # beats are computed from their tempo segment instead
+    MAX_TICKS = TICKS_PER_BEAT * 16384
+
+    def __init__(self, bpm=120, changes=(), sample_rate=44100):
+        changes = sorted(((float(beat), float(new_bpm)) for beat, new_bpm in changes), key=lambda change: change[0])
+        # A change at beat 0 is the starting tempo, like a tempo event at tick 0 in a MIDI file
+        for beat, new_bpm in changes:
+            if beat <= 0:
+                bpm = new_bpm
+        self.bpm = bpm
+        self.sample_rate = sample_rate
+        # (beat, bpm) pairs, the first segment always starts at beat 0
+        self.changes = tuple(change for change in changes if change[0] > 0)
+        self.key = (bpm, self.changes, sample_rate)
+
+        segment_beats = [0.0] + [beat for beat, _ in self.changes]
+        segment_bpms = [float(bpm)] + [new_bpm for _, new_bpm in self.changes]
+        self.segment_ticks = np.array(segment_beats) * self.TICKS_PER_BEAT
+        self.segment_samples_per_tick = sample_rate * 60 / (np.array(segment_bpms) * self.TICKS_PER_BEAT)
+        # Exact (unrounded) sample position where each segment starts
+        lengths = np.diff(self.segment_ticks) * self.segment_samples_per_tick[:-1]
+        self.segment_start_samples = np.concatenate(([0.0], np.cumsum(lengths)))
+        self.segment_bpms = np.array(segment_bpms)
+
+        self.tick_samples = np.empty(0, dtype=np.int64)
+        self._extend(self.INITIAL_TICKS)
+
+    def __eq__(self, other):
+        return isinstance(other, TempoMap) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def _exact_samples(self, ticks):
+        ticks = np.asarray(ticks, dtype=np.float64)
+        segment = np.searchsorted(self.segment_ticks, ticks, side="right") - 1
+        return (self.segment_start_samples[segment]
+                + (ticks - self.segment_ticks[segment]) * self.segment_samples_per_tick[segment])
+
+    def _extend(self, num_ticks):
+        ticks = np.arange(len(self.tick_samples), num_ticks)
+        self.tick_samples = np.concatenate((self.tick_samples, np.round(self._exact_samples(ticks)).astype(np.int64)))
+
+    def _ensure(self, tick):
+        """Grow the table to hold `tick`, returning False when it is past MAX_TICKS"""
+        if tick < len(self.tick_samples):
+            return True
+        if tick >= self.MAX_TICKS:
+            return False
+        self._extend(min(max(2 * len(self.tick_samples), int(tick) + 2), self.MAX_TICKS))
+        return True
+
+    def beat_to_sample(self, beat):
+        """Sample index where `beat` starts"""
+        tick = beat * self.TICKS_PER_BEAT
+        whole = int(tick)
+        if tick == whole and self._ensure(whole):
+            return int(self.tick_samples[whole])
+        # Off the tick grid or past the table, round from the exact position instead
+        return int(round(float(self._exact_samples(tick))))
+
+    def beats_to_samples(self, beats):
+        """Vectorized beat_to_sample for an array of beats"""
+        ticks = np.asarray(beats, dtype=np.float64) * self.TICKS_PER_BEAT
+        if not ticks.size:
+            return np.zeros(ticks.shape, dtype=np.int64)
+        whole = ticks.astype(np.int64)
+        self._ensure(min(int(whole.max()), self.MAX_TICKS - 1))
+        on_grid = (ticks == whole) & (whole < len(self.tick_samples))
+        samples = self.tick_samples[np.where(on_grid, whole, 0)]
+        if not on_grid.all():
+            samples = np.where(on_grid, samples, np.round(self._exact_samples(ticks)).astype(np.int64))
+        return samples
+
+    def bpm_at(self, beat):
+        segment = int(np.searchsorted(self.segment_ticks, beat * self.TICKS_PER_BEAT, side="right")) - 1
+        return float(self.segment_bpms[segment])
+
+
+_constant_maps = {}
+
+
+def as_tempo_map(tempo, sample_rate=44100):
+    """Accept a TempoMap or a plain bpm, sharing one map per constant tempo"""
+    if isinstance(tempo, TempoMap):
+        return tempo
+    key = (tempo, sample_rate)
+    if key not in _constant_maps:
+        _constant_maps[key] = TempoMap(tempo, sample_rate=sample_rate)
+    return _constant_maps[key]
@@ -0,0 +1,78 @@
+import numpy as np
+
+from event_stream import encode_event_stream, decode_event_stream
+from instruments import Instrument, instrument_bank
+from notes import NoteEvent
+from sequencer import Track, Sequencer
+from song import Song
+
+
+def note_fields(note):
+    instrument = None if note.instrument is None else vars(instrument_bank.instruments[note.instrument])
+    return (note.note, note.start_beat, note.duration_beats, note.volume, note.waveform_type, note.effects,
+            instrument)
+
+
+def make_song():
+    wave = instrument_bank.find_or_add(Instrument("round-trip wave", waveform="wavetable",
+                                                  wavetable=[0.0, 0.5, 1.0, -0.25], release=0.05))
+    pulse = instrument_bank.find_or_add(Instrument("round-trip pulse", duty_cycle=0.125, attack=0.0,
+                                                   sustain_level=0.6, volume=0.2))
+
+    seq = Sequencer(bpm=140, channels=2, sample_rate=48000, tempo_changes=[(0, 100), (2.5, 150), (5, 90)])
+    lead = Track("lead", pan=-0.75)
+    lead.add_notes([
+        NoteEvent("C 4", start_beat=0, duration_beats=0.5, effects=["A37"]),
+        # Off the 96 tick grid, so the exporter needs a finer resolution
+        NoteEvent("E 4", start_beat=0.2, duration_beats=0.4, instrument=wave),
+        NoteEvent("G 4", start_beat=1, duration_beats=3, volume=0.3, waveform_type="sine",
+                  effects=[("V", 0x12), ("P", 0x04)]),
+        NoteEvent("C 5", start_beat=4.75, duration_beats=1.25, instrument=pulse, effects=["W02"]),
+    ])
+    bass = Track("bass", pan=0.5)
+    bass.add_notes([
+        NoteEvent("C 2", start_beat=0, duration_beats=4, waveform_type="sawtooth"),
+        NoteEvent("G 2", start_beat=4, duration_beats=2, instrument=pulse),
+        NoteEvent("G 2", start_beat=6, duration_beats=0.25, instrument=pulse, effects=["E08"]),
+    ])
+    seq.add_track(lead)
+    seq.add_track(bass)
+    return Song("round trip", seq, duration=8, num_of_loops=3)
+
+
+def test_event_stream_round_trip():
+    song = make_song()
+    decoded = decode_event_stream(encode_event_stream(song))
+
+    assert decoded.name == song.name
+    assert (decoded.duration, decoded.num_of_loops) == (song.duration, song.num_of_loops)
+    seq, decoded_seq = song.sequencer, decoded.sequencer
+    assert decoded_seq.tempo_map == seq.tempo_map
+    assert decoded_seq.bpm == 100
+    assert (decoded_seq.sample_rate, decoded_seq.channels) == (seq.sample_rate, seq.channels)
+
+    assert [(track.name, track.pan) for track in decoded_seq.tracks] == [(track.name, track.pan)
+                                                                          for track in seq.tracks]
+    for track, decoded_track in zip(seq.tracks, decoded_seq.tracks):
+        expected = sorted(note_fields(note) for note in track.notes)
+        assert sorted(note_fields(note) for note in decoded_track.notes) == expected
+
+    np.testing.assert_array_equal(decoded_seq.render(decoded.duration, decoded.num_of_loops),
+                                  seq.render(song.duration, song.num_of_loops))
+
+
+def test_event_stream_uses_bank_instruments_by_definition():
+    song = make_song()
+    data = encode_event_stream(song)
+    # Same definitions under other ids, as in a process whose bank was filled in another order
+    saved = list(instrument_bank.instruments)
+    try:
+        instrument_bank.instruments[:] = saved[:4]
+        instrument_bank.add(Instrument("unrelated", waveform="noise"))
+        decoded = decode_event_stream(data)
+        for track, decoded_track in zip(song.sequencer.tracks, decoded.sequencer.tracks):
+            assert ([vars(saved[note.instrument]) for note in track.notes if note.instrument is not None]
+                    == [vars(instrument_bank.instruments[note.instrument])
+                        for note in decoded_track.notes if note.instrument is not None])
+    finally:
+        instrument_bank.instruments[:] = saved
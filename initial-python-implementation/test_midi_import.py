@@ -0,0 +1,49 @@
+import struct
+
+import numpy as np
+
+from midi_import import import_midi
+
+
+def write_variable_length(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+def write_smf(path, notes, division=480, tempo=500000):
+    """Write a one-track SMF with (start tick, length in ticks, channel, pitch) notes"""
+    events = []
+    for start, length, channel, pitch in notes:
+        events.append((start, bytes([0x90 | channel, pitch, 100])))
+        events.append((start + length, bytes([0x80 | channel, pitch, 0])))
+    events.sort(key=lambda event: event[0])
+
+    track = write_variable_length(0) + b"\xff\x51\x03" + tempo.to_bytes(3, "big")
+    tick = 0
+    for event_tick, data in events:
+        track += write_variable_length(event_tick - tick) + data
+        tick = event_tick
+    track += write_variable_length(0) + b"\xff\x2f\x00"
+
+    with open(path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, division))
+        f.write(b"MTrk" + struct.pack(">I", len(track)) + track)
+
+
+def test_imported_short_notes_render(tmp_path):
+    # 1/8 beat notes and drum hits are shorter than the default attack + decay
+    notes = [(i * 60, 60, 0, 60 + i % 12) for i in range(64)]
+    notes += [(i * 240, 30, 9, 36) for i in range(16)]
+    path = tmp_path / "short.mid"
+    write_smf(path, notes, tempo=60_000_000 // 160)
+
+    song = import_midi(str(path))
+    output = song.sequencer.render(song.duration, song.num_of_loops)
+
+    assert len(output) == song.sequencer.phrase_samples(song.duration)
+    assert np.all(np.isfinite(output))
+    assert np.max(np.abs(output)) > 0
@@ -0,0 +1,65 @@
+import random
+
+import numpy as np
+import pytest
+
+from note_index import NoteIndex
+from notes import NoteEvent
+from sequencer import Track, Sequencer
+from tempo import TempoMap
+
+
+def brute_force_overlapping(index, start_index, end_index):
+    return [note for note, start, end in zip(index.notes, index.starts, index.ends)
+            if start < end_index and end > start_index]
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(7)
+    tempo_map = TempoMap(120, [(0, 100), (8, 90), (20, 180)], 44100)
+    # Mostly short notes with a few zero length and very long ones, like a drone under a melody
+    notes = [NoteEvent("C 4", start_beat=rng.randrange(0, 320) / 8,
+                       duration_beats=rng.choice([0, 1 / 16, 0.25, 1, 3, 64]))
+             for _ in range(1500)]
+    index = NoteIndex(notes, tempo_map, 44100)
+
+    last_end = int(index.ends.max())
+    windows = [(0, 1), (0, last_end), (last_end, last_end + 4096), (-4096, 0)]
+    for _ in range(2000):
+        start = rng.randrange(-4096, last_end + 4096)
+        windows.append((start, start + rng.randrange(1, 50000)))
+    for start, end in windows:
+        assert index.overlapping(start, end) == brute_force_overlapping(index, start, end)
+
+
+def test_overlapping_empty_track():
+    assert NoteIndex([], 120).overlapping(0, 44100) == []
+
+
+def make_sequencer(block_size, channels=1):
+    seq = Sequencer(bpm=120, block_size=block_size, channels=channels, tempo_changes=[(2, 150)])
+    lead = Track("lead", pan=-0.5)
+    # Notes running past the end of the phrase, and one held across several blocks
+    lead.add_notes([NoteEvent("C 4", start_beat=beat / 2, duration_beats=0.75, waveform_type="sawtooth")
+                    for beat in range(8)])
+    lead.add_note(NoteEvent("E 4", start_beat=3.5, duration_beats=2, effects=[("A", 2)]))
+    bass = Track("bass", pan=0.5)
+    bass.add_notes([NoteEvent("C 2", start_beat=0, duration_beats=4, waveform_type="sine"),
+                    NoteEvent("G 2", start_beat=1.25, duration_beats=0.5, waveform_type="square")])
+    seq.add_track(lead)
+    seq.add_track(bass)
+    return seq
+
+
+@pytest.mark.parametrize("block_size", [1000, 4096, 500_000])
+@pytest.mark.parametrize("start_beat", [0, 1.5])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_iter_blocks_matches_render_block(block_size, start_beat, channels):
+    duration, num_of_loops = 4, 3
+    seq = make_sequencer(block_size, channels)
+    phrase = seq.render_block(0, seq.phrase_samples(duration))
+    expected = np.concatenate([phrase] * num_of_loops)[seq.phrase_samples(start_beat):]
+
+    blocks = [block.copy() for block in seq.iter_blocks(duration, num_of_loops, start_beat=start_beat)]
+    assert all(len(block) <= block_size for block in blocks)
+    np.testing.assert_allclose(np.concatenate(blocks), expected, atol=1e-6)
@@ -0,0 +1,73 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from tempo import TempoMap
+
+
+def exact_sample(beat, bpm, changes, sample_rate):
+    """Sample position of `beat` as an exact fraction, added up segment by segment"""
+    beat = Fraction(beat)
+    segments = [(Fraction(0), Fraction(bpm))]
+    for change_beat, change_bpm in sorted(changes):
+        if change_beat <= 0:
+            segments[0] = (Fraction(0), Fraction(change_bpm))
+        else:
+            segments.append((Fraction(change_beat), Fraction(change_bpm)))
+    seconds = Fraction(0)
+    for (segment_beat, segment_bpm), next_segment in zip(segments, segments[1:] + [(None, None)]):
+        if beat <= segment_beat:
+            break
+        segment_end = beat if next_segment[0] is None else min(beat, next_segment[0])
+        seconds += (segment_end - segment_beat) * 60 / segment_bpm
+    return seconds * sample_rate
+
+
+def assert_nearest_sample(sample, beat, bpm, changes, sample_rate):
+    # Exact halves may round either way depending on float error
+    assert abs(sample - exact_sample(beat, bpm, changes, sample_rate)) <= Fraction(1, 2), beat
+
+
+TEMPOS = [
+    (120, []),
+    (120, [(4, 90), (10.5, 175), (11, 60)]),
+    # A change at beat 0 replaces the starting tempo
+    (120, [(0, 100), (6, 133)]),
+    (97, [(0.25, 241), (3, 97)]),
+]
+
+
+@pytest.mark.parametrize("bpm, changes", TEMPOS)
+@pytest.mark.parametrize("sample_rate", [44100, 48000])
+def test_beat_to_sample_matches_exact_formula(bpm, changes, sample_rate):
+    tempo_map = TempoMap(bpm, changes, sample_rate)
+    # On the tick grid, off it, and past the precomputed table
+    beats = [i / 8 for i in range(200)] + [1 / 3, 2.71, 4 - 1e-9, 63.99, 64, 65.5, 1000.125, 100_000]
+    for beat in beats:
+        assert_nearest_sample(tempo_map.beat_to_sample(beat), beat, bpm, changes, sample_rate)
+
+
+@pytest.mark.parametrize("bpm, changes", TEMPOS)
+def test_beats_to_samples_matches_beat_to_sample(bpm, changes):
+    tempo_map = TempoMap(bpm, changes)
+    beats = np.concatenate((np.arange(0, 40, 1 / 96), [1 / 3, 12.001, 5000, TempoMap.MAX_TICKS / 96 + 0.5, 1e6]))
+    samples = tempo_map.beats_to_samples(beats)
+    assert samples.dtype == np.int64
+    assert samples.tolist() == [tempo_map.beat_to_sample(beat) for beat in beats.tolist()]
+    assert len(tempo_map.tick_samples) <= TempoMap.MAX_TICKS
+
+
+def test_change_at_beat_zero_sets_starting_tempo():
+    tempo_map = TempoMap(120, [(0, 60)], 44100)
+    assert tempo_map.bpm == 60
+    assert tempo_map.changes == ()
+    assert tempo_map.beat_to_sample(1) == 44100
+    assert tempo_map == TempoMap(60, sample_rate=44100)
+
+
+def test_far_beats_do_not_grow_the_table():
+    tempo_map = TempoMap(120, [(2, 150)])
+    assert_nearest_sample(tempo_map.beat_to_sample(1e9), 1e9, 120, [(2, 150)], 44100)
+    tempo_map.beats_to_samples(np.array([0, 1e9]))
+    assert len(tempo_map.tick_samples) <= TempoMap.MAX_TICKS
@@ -5,13 +5,18 @@ from textual.events import Key
 from textual.widget import Widget
 from textual.widgets import Header, Footer, DataTable, Input, Static
 from textual.coordinate import Coordinate
-from notes import NoteEvent, get_next_note_in_scale, change_octave, note_frequency_chart
-from sequencer import Track, Sequencer
+from textual.worker import get_current_worker
+from notes import NoteEvent, note_frequency_chart
+from phrase_model import PhraseModel, NOTE_COLUMN, DURATION_COLUMN, INSTRUMENT_COLUMN, FX_COLUMN
+from sequencer import Track, Sequencer, RenderCancelled
+from visualizer import Visualizer
 import sounddevice as sd
 import numpy as np
 import threading
 import time
 import asyncio
+from functools import partial
+import sys
 
 import sequencer
 
@@ -94,33 +99,45 @@ class RealTimeNotePlayer:
 
 
 class Phrases(Widget):
+    # Rows drawn at once; only this window of the phrase lives in the DataTable
+    VISIBLE_ROWS = 16
+    # Seconds without edits before the phrase is re-rendered in the background
+    PRERENDER_DELAY = 0.3
+    PLAYBACK_LOOPS = 2
+    BPM = 120
+
+    def __init__(self, num_rows=15, **kwargs):
+        super().__init__(**kwargs)
+        self.num_rows = num_rows
 
     def on_mount(self) -> None:
         # self.styles.border = ("round", "white")
         self.phrase = self.query_one(DataTable)
         self.phrase.show_header = True
         self.phrase.show_header=True
-        self.phrase.show_row_labels=True
+        # Row numbers are a regular column so they can follow the scroll window
+        self.phrase.show_row_labels=False
         self.phrase.zebra_stripes=True
         self.phrase.cursor_type="cell"
 
-        self.phrase.add_columns("Note", "Duration", "Wave")
+        # The model is the source of truth, the DataTable only displays it
+        self.model = PhraseModel(num_rows=self.num_rows)
+        self.row_label_width = max(2, len(f"{self.model.num_rows - 1:X}"))
+
+        self.phrase.add_columns("Row", *PhraseModel.COLUMNS)
 
-        for i in range(15):
-            # row = ["----", "----", "------"] 
-            row = ["----", "1/16", "square  "]
-            self.phrase.add_row(*row, label=f"{i:02X}", key=f"{i:02X}")
+        # First phrase row shown in the table
+        self.window_offset = 0
+        self.window_rows = min(self.VISIBLE_ROWS, self.model.num_rows)
+        for i in range(self.window_rows):
+            self.phrase.add_row(*self.window_row_text(i), key=f"{i:02X}")
 
         self.query_one("#edit_input").display = False
+        # Selected (phrase row, model column), independent of the scroll window
         self.selected_cell = Coordinate(0, 0)
+        self.phrase.move_cursor(row=0, column=1)
         self.edit_mode = False  # Track if we're in note editing mode
         
-        # Duration options (in 4:4 time signature)
-        self.duration_options = ["1/32", "1/16", "1/8", "1/4", "1/2", "1"]
-        
-        # Wave options
-        self.wave_options = ["square", "sine", "sawtooth", "noise"]
-        
         # Initialize real-time note player
         self.note_player = RealTimeNotePlayer()
         
@@ -128,6 +145,13 @@ class Phrases(Widget):
         self.playback_active = False
         self.current_playback_row = -1
         self.playback_highlight_task = None
+        self.playback_stream = None
+
+        # Background pre-render, refreshed after every edit so play starts instantly
+        self.render_generation = 0
+        self.prerendered = None  # (render_generation, output)
+        self.prerender_timer = None
+        self.schedule_prerender()
         
         self.update_status_bar()
 
@@ -148,7 +172,7 @@ class Phrases(Widget):
             elif self.playback_active:
                 status_text = "[PLAYBACK] | Playing sequence..."
             else:
-                status_text = "[NAVIGATION] | <Enter> Edit Cell | <Backspace> Clear Cell | <P> Play Sequence"
+                status_text = "[NAVIGATION] | <Enter> Edit Cell | <Backspace> Clear Cell | <p> Play Sequence | <P> Play From Row"
             
             status_widget.update(status_text)
         except:
@@ -156,32 +180,111 @@ class Phrases(Widget):
             pass
 
 
+    def window_row_text(self, table_row):
+        row = self.window_offset + table_row
+        return [f"{row:0{self.row_label_width}X}", *self.model.row_text(row)]
+
+
+    def sync_table(self):
+        """Redraw only the visible cells that changed in the model"""
+        dirty = self.model.take_dirty()
+        for row, column in dirty:
+            table_row = row - self.window_offset
+            if 0 <= table_row < self.window_rows:
+                self.phrase.update_cell_at(Coordinate(table_row, column + 1), self.model.cell_text(row, column))
+        if dirty:
+            self.schedule_prerender()
+
+
+    def build_sequencer(self):
+        sequencer = Sequencer(bpm=self.BPM)
+        sequencer.add_track(self.convert_table_to_track())
+        return sequencer
+
+
+    def schedule_prerender(self):
+        """Debounce a background render of the phrase, invalidating the current one"""
+        self.render_generation += 1
+        if self.prerender_timer is not None:
+            self.prerender_timer.stop()
+        self.prerender_timer = self.set_timer(self.PRERENDER_DELAY, self.start_prerender)
+
+
+    def start_prerender(self):
+        # Snapshot the phrase on the UI thread, exclusive cancels a render still in flight
+        sequencer = self.build_sequencer()
+        self.run_worker(
+            partial(self.prerender, sequencer, self.model.length_beats, self.render_generation),
+            thread=True, exclusive=True, group="prerender",
+        )
+
+
+    def prerender(self, sequencer, duration, generation):
+        """Runs on a worker thread, gives up as soon as a newer edit arrives"""
+        worker = get_current_worker()
+
+        def should_stop():
+            return worker.is_cancelled or generation != self.render_generation
+
+        try:
+            output = sequencer.render(duration, self.PLAYBACK_LOOPS, should_stop=should_stop)
+        except RenderCancelled:
+            return
+        self.app.call_from_thread(self.store_prerender, generation, output)
+
+
+    def store_prerender(self, generation, output):
+        if generation == self.render_generation:
+            self.prerendered = (generation, output)
+
+
+    def scroll_to(self, offset):
+        """Move the window to start at phrase row `offset`, redrawing only the visible rows"""
+        offset = max(0, min(offset, self.model.num_rows - self.window_rows))
+        if offset == self.window_offset:
+            return
+        self.window_offset = offset
+        for table_row in range(self.window_rows):
+            for column, text in enumerate(self.window_row_text(table_row)):
+                self.phrase.update_cell_at(Coordinate(table_row, column), text)
+        # Cells redrawn above are already current
+        self.model.take_dirty()
+        # Keep the cursor on the selected cell while it's in the window
+        table_row = self.selected_cell.row - offset
+        if 0 <= table_row < self.window_rows:
+            self.phrase.move_cursor(row=table_row, column=self.selected_cell.column + 1)
+
+
+    def scroll_into_view(self, row):
+        if row < self.window_offset:
+            self.scroll_to(row)
+        elif row >= self.window_offset + self.window_rows:
+            self.scroll_to(row - self.window_rows + 1)
+
+
+    def select_cell(self, row, column):
+        """Select a phrase cell, scrolling the window to keep it visible"""
+        row = max(0, min(row, self.model.num_rows - 1))
+        column = max(0, min(column, len(PhraseModel.COLUMNS) - 1))
+        self.selected_cell = Coordinate(row, column)
+        self.scroll_into_view(row)
+        self.phrase.move_cursor(row=row - self.window_offset, column=column + 1)
+
+
     def on_data_table_cell_selected(self, event: DataTable.CellSelected):
-        row_key = event.coordinate.row
-        column_index = event.coordinate.column
+        row_key = self.window_offset + event.coordinate.row
+        column_index = max(event.coordinate.column - 1, 0)
 
         self.selected_cell = Coordinate(row_key, column_index)
         print(f"Selected cell at row {row_key}, column {column_index}")
 
 
-    def get_next_option(self, current_value, options, direction=1):
-        """Get the next option in a list of options"""
-        if not current_value or current_value == "----":
-            return options[0] if direction > 0 else options[-1]
-        
-        try:
-            current_index = options.index(current_value)
-            new_index = current_index + direction
-            
-            # Handle wrapping
-            if new_index >= len(options):
-                new_index = 0
-            elif new_index < 0:
-                new_index = len(options) - 1
-            
-            return options[new_index]
-        except ValueError:
-            return options[0] if direction > 0 else options[-1]
+    def on_data_table_cell_highlighted(self, event: DataTable.CellHighlighted):
+        # Mouse clicks and the table's own left/right keys move its cursor directly
+        row = self.window_offset + event.coordinate.row
+        column = max(event.coordinate.column - 1, 0)
+        if (row, column) != tuple(self.selected_cell):
+            self.select_cell(row, column)
 
 
     async def highlight_playback_row(self, row_index):
@@ -194,66 +297,64 @@ class Phrases(Widget):
             # self.phrase.get_row_at(self.current_playback_row).styles.background = None
             pass
         
-        # Set new highlight
-        if 0 <= row_index < 15:
+        # Set new highlight, paging the window along with playback
+        if 0 <= row_index < self.model.num_rows:
             self.current_playback_row = row_index
+            if not self.edit_mode and not self.window_offset <= row_index < self.window_offset + self.window_rows:
+                self.scroll_to(row_index)
             # self.phrase.get_row_at(row_index).styles.background = "blue"
         else:
             self.current_playback_row = -1
 
 
-    async def playback_highlight_loop(self, bpm=120, num_loops=2):
-        """Loop that highlights rows in time with the music"""
+    async def playback_highlight_loop(self, tempo_map, num_loops=2, start_row=0):
+        """Loop that highlights rows in time with the music, the first loop from start_row"""
         self.playback_active = True
         self.update_status_bar()
         
-        # Calculate time per 16th note (assuming 4/4 time signature)
-        beats_per_measure = 4
-        sixteenth_note_duration = 60.0 / bpm / 4  # seconds per 16th note
+        # Row times come from the same sample positions the audio was rendered at,
+        # and each wait is to an absolute time so sleep overshoot never accumulates
+        sample_rate = tempo_map.sample_rate
+        start_sample = tempo_map.beat_to_sample(start_row * PhraseModel.ROW_BEATS)
+        phrase_len = tempo_map.beat_to_sample(self.model.length_beats)
+        started = time.perf_counter()
         
         total_loops = num_loops
         current_loop = 0
         
         try:
             while current_loop < total_loops and self.playback_active:
-                # Highlight each row for the duration of a 16th note
-                for row in range(15):
+                first_row = start_row if current_loop == 0 else 0
+                loop_offset = current_loop * phrase_len - start_sample
+                for row in range(first_row, self.model.num_rows):
                     if not self.playback_active:
                         break
                     
-                    # Highlight the current row
+                    row_sample = loop_offset + tempo_map.beat_to_sample(row * PhraseModel.ROW_BEATS)
+                    await asyncio.sleep(max(started + row_sample / sample_rate - time.perf_counter(), 0))
                     await self.highlight_playback_row(row)
-                    
-                    # Wait for the duration of a 16th note
-                    await asyncio.sleep(sixteenth_note_duration)
                 
                 current_loop += 1
-                
-                # If we're looping, continue to the next loop
-                if current_loop < total_loops and self.playback_active:
-                    await asyncio.sleep(0.1)  # Small gap between loops
+            
+            # Hold the last row until the audio reaches the end
+            end_sample = total_loops * phrase_len - start_sample
+            await asyncio.sleep(max(started + end_sample / sample_rate - time.perf_counter(), 0))
                     
         except Exception as e:
             print(f"Error in playback highlight loop: {e}")
         finally:
-            # Clear highlight when done
-            await self.highlight_playback_row(-1)
-            self.playback_active = False
-            self.update_status_bar()
+            # A restarted playback cancels this task, and then the new loop owns the highlight
+            if self.playback_highlight_task is asyncio.current_task():
+                await self.highlight_playback_row(-1)
+                self.playback_active = False
+                self.update_status_bar()
 
 
     def on_key(self, event: Key) -> None:
         # Handle backspace to clear cells
         if event.key == "backspace":
-            # Determine default value based on column
-            if self.selected_cell.column == 0:  # Note column
-                default_value = "----"
-            elif self.selected_cell.column == 1:  # Duration column
-                default_value = "1/16"
-            else:  # Wave column
-                default_value = "square"
-            
-            self.phrase.update_cell_at(self.selected_cell, default_value)
+            self.model.clear_cell(self.selected_cell.row, self.selected_cell.column)
+            self.sync_table()
             event.stop()
             return
         
@@ -271,33 +372,12 @@ class Phrases(Widget):
             # Get the current cursor position from the DataTable
             current_cursor = self.phrase.cursor_coordinate
             if current_cursor:
-                self.selected_cell = current_cursor
+                self.selected_cell = Coordinate(self.window_offset + current_cursor.row, max(current_cursor.column - 1, 0))
             self.edit_mode = True
             
             # Play the current note when entering edit mode (only for note column)
-            if self.selected_cell.column == 0:
-                current_value = self.phrase.get_cell_at(self.selected_cell)
-                if current_value and current_value != "----":
-                    # Get duration and wave from the same row
-                    duration_value = self.phrase.get_cell_at(Coordinate(self.selected_cell.row, 1))
-                    wave_value = self.phrase.get_cell_at(Coordinate(self.selected_cell.row, 2))
-                    
-                    # Convert duration to seconds for playback
-                    duration_seconds = 0.75  # default
-                    if duration_value and duration_value != "----":
-                        try:
-                            numerator_str, denominator_str = duration_value.split("/")
-                            numerator = int(numerator_str)
-                            denominator = int(denominator_str)
-                            # Convert to seconds (assuming 120 BPM)
-                            duration_seconds = (numerator / denominator) * (60 / 120)
-                        except:
-                            duration_seconds = 0.75
-                    
-                    # Use specified wave type or default to square
-                    wave_type = wave_value if wave_value and wave_value != "------" else "square"
-                    
-                    self.note_player.play_note(current_value, duration=duration_seconds, waveform_type=wave_type)
+            if self.selected_cell.column == NOTE_COLUMN:
+                self.play_current_note_with_settings()
             
             self.update_status_bar()
             event.stop()
@@ -305,199 +385,136 @@ class Phrases(Widget):
         
         # Cell editing (only when in edit mode)
         if self.edit_mode:
-            current_value = self.phrase.get_cell_at(self.selected_cell)
+            row, column = self.selected_cell.row, self.selected_cell.column
             
-            if event.key in ["k", "up"]:  # up - next option
-                if self.selected_cell.column == 0:  # Note column
-                    new_value = get_next_note_in_scale(current_value, 1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                    # Play the new note immediately with current duration and wave
-                    self.play_current_note_with_settings(new_value)
-                elif self.selected_cell.column == 1:  # Duration column
-                    new_value = self.get_next_option(current_value, self.duration_options, 1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                elif self.selected_cell.column == 2:  # Wave column
-                    new_value = self.get_next_option(current_value, self.wave_options, 1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                    # If we're editing wave, play the current note with new wave
-                    note_value = self.phrase.get_cell_at(Coordinate(self.selected_cell.row, 0))
-                    if note_value and note_value != "----":
-                        self.play_current_note_with_settings(note_value)
-                event.stop()
-                return
-            elif event.key in ["j", "down"]:  # down - previous option
-                if self.selected_cell.column == 0:  # Note column
-                    new_value = get_next_note_in_scale(current_value, -1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                    # Play the new note immediately with current duration and wave
-                    self.play_current_note_with_settings(new_value)
-                elif self.selected_cell.column == 1:  # Duration column
-                    new_value = self.get_next_option(current_value, self.duration_options, -1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                elif self.selected_cell.column == 2:  # Wave column
-                    new_value = self.get_next_option(current_value, self.wave_options, -1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                    # If we're editing wave, play the current note with new wave
-                    note_value = self.phrase.get_cell_at(Coordinate(self.selected_cell.row, 0))
-                    if note_value and note_value != "----":
-                        self.play_current_note_with_settings(note_value)
+            if event.key in ["k", "up", "j", "down"]:  # up - next option, down - previous option
+                direction = 1 if event.key in ["k", "up"] else -1
+                self.model.step_cell(row, column, direction)
+                self.sync_table()
+                # Play the note with the new pitch or instrument (duration and effect changes are silent)
+                if column in (NOTE_COLUMN, INSTRUMENT_COLUMN):
+                    self.play_current_note_with_settings()
                 event.stop()
                 return
-            elif event.key in ["l", "right"]:  # right - octave up (only for notes)
-                if self.selected_cell.column == 0:  # Note column
-                    new_value = change_octave(current_value, 1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
+            elif event.key in ["l", "right", "h", "left"]:  # octave up/down for notes, effect value for FX
+                direction = 1 if event.key in ["l", "right"] else -1
+                if column == NOTE_COLUMN:
+                    self.model.step_octave(row, direction)
+                    self.sync_table()
                     # Play the new note immediately with current duration and wave
-                    self.play_current_note_with_settings(new_value)
+                    self.play_current_note_with_settings()
                     event.stop()
                     return
-            elif event.key in ["h", "left"]:  # left - octave down (only for notes)
-                if self.selected_cell.column == 0:  # Note column
-                    new_value = change_octave(current_value, -1)
-                    self.phrase.update_cell_at(self.selected_cell, new_value)
-                    # Play the new note immediately with current duration and wave
-                    self.play_current_note_with_settings(new_value)
+                elif column == FX_COLUMN:
+                    self.model.step_effect_param(row, direction)
+                    self.sync_table()
                     event.stop()
                     return
         
         # Vim-style navigation (only when not in edit mode)
         if not self.edit_mode:
             if event.key == "h":  # left
-                if self.selected_cell.column > 0:
-                    self.selected_cell = Coordinate(self.selected_cell.row, self.selected_cell.column - 1)
-                    self.phrase.move_cursor(row=self.selected_cell.row, column=self.selected_cell.column)
+                self.select_cell(self.selected_cell.row, self.selected_cell.column - 1)
             elif event.key == "l":  # right
-                if self.selected_cell.column < 2:  # 3 columns (0-2)
-                    self.selected_cell = Coordinate(self.selected_cell.row, self.selected_cell.column + 1)
-                    self.phrase.move_cursor(row=self.selected_cell.row, column=self.selected_cell.column)
-            elif event.key == "k":  # up
-                if self.selected_cell.row > 0:
-                    self.selected_cell = Coordinate(self.selected_cell.row - 1, self.selected_cell.column)
-                    self.phrase.move_cursor(row=self.selected_cell.row, column=self.selected_cell.column)
-            elif event.key == "j":  # down
-                if self.selected_cell.row < 14:  # 15 rows (0-14)
-                    self.selected_cell = Coordinate(self.selected_cell.row + 1, self.selected_cell.column)
-                    self.phrase.move_cursor(row=self.selected_cell.row, column=self.selected_cell.column)
+                self.select_cell(self.selected_cell.row, self.selected_cell.column + 1)
+            elif event.key in ["k", "up"]:  # up
+                self.select_cell(self.selected_cell.row - 1, self.selected_cell.column)
+                event.stop()
+            elif event.key in ["j", "down"]:  # down
+                self.select_cell(self.selected_cell.row + 1, self.selected_cell.column)
+                event.stop()
+            elif event.key == "pageup":
+                self.select_cell(self.selected_cell.row - self.window_rows, self.selected_cell.column)
+                event.stop()
+            elif event.key == "pagedown":
+                self.select_cell(self.selected_cell.row + self.window_rows, self.selected_cell.column)
+                event.stop()
+            elif event.key == "ctrl+u":  # half page up
+                self.select_cell(self.selected_cell.row - self.window_rows // 2, self.selected_cell.column)
+            elif event.key == "ctrl+d":  # half page down
+                self.select_cell(self.selected_cell.row + self.window_rows // 2, self.selected_cell.column)
+            elif event.key == "g":  # first row
+                self.select_cell(0, self.selected_cell.column)
+            elif event.key == "G":  # last row
+                self.select_cell(self.model.num_rows - 1, self.selected_cell.column)
             elif event.key == "p":  # play phrase sequence
                 self.play_phrase_sequence()
                 event.stop()
                 return
+            elif event.key == "P":  # play from the selected row
+                self.play_phrase_sequence(start_row=self.selected_cell.row)
+                event.stop()
+                return
             elif event.key == "e":
                 # row, col = self.selected_cell
-                current_value = self.phrase.get_cell_at(self.selected_cell)
+                current_value = self.model.cell_text(self.selected_cell.row, self.selected_cell.column).strip()
                 input_widget = self.query_one("#edit_input", Input)
-                input_widget.value = str(current_value)
+                input_widget.value = current_value
                 input_widget.compact = True
                 input_widget.display = True
-                input_widget.max_length = 4
+                input_widget.max_length = 8
                 input_widget.focus()
             elif event.key == "t":  # test note
-                new_value = "C 4"
-                self.phrase.update_cell_at(self.selected_cell, new_value)
-                # Set default duration and wave for this row
-                self.phrase.update_cell_at(Coordinate(self.selected_cell.row, 1), "1/16")
-                self.phrase.update_cell_at(Coordinate(self.selected_cell.row, 2), "square")
+                row = self.selected_cell.row
+                self.model.set_cell_text(row, NOTE_COLUMN, "C 4")
+                # Set default duration and instrument for this row
+                self.model.clear_cell(row, DURATION_COLUMN)
+                self.model.clear_cell(row, INSTRUMENT_COLUMN)
+                self.sync_table()
                 test = Track("test")
                 test.add_note(NoteEvent('C 4', start_beat=0, duration_beats=1, volume=0.1, waveform_type='sawtooth'))
-                seq = Sequencer(bpm=120)
+                seq = Sequencer(bpm=self.BPM)
                 seq.add_track(test)
                 seq.play_once(1)
 
-    def play_current_note_with_settings(self, note_value):
-        """Play a note using the duration and wave settings from the current row"""
-        if not note_value or note_value == "----":
+    def play_current_note_with_settings(self):
+        """Play the selected row's note using its duration and instrument settings"""
+        row = self.selected_cell.row
+        note_value = self.model.note_name(row)
+        if note_value is None:
             return
             
-        # Get duration and wave from the same row
-        duration_value = self.phrase.get_cell_at(Coordinate(self.selected_cell.row, 1))
-        wave_value = self.phrase.get_cell_at(Coordinate(self.selected_cell.row, 2))
-        
-        # Convert duration to seconds for playback
-        duration_seconds = 0.75  # default
-        if duration_value and duration_value != "----":
-            try:
-                numerator_str, denominator_str = duration_value.split("/")
-                numerator = int(numerator_str)
-                denominator = int(denominator_str)
-                # Convert to seconds (assuming 120 BPM)
-                duration_seconds = (numerator / denominator) * (60 / 120)
-            except:
-                duration_seconds = 0.75
+        # Preview length is the duration as a fraction of a whole note, in seconds at the phrase tempo
+        duration_seconds = self.model.duration_beats(row) / 4 * (60 / self.BPM)
         
-        # Use specified wave type or default to square
-        wave_type = wave_value if wave_value and wave_value != "------" else "square"
-        
-        self.note_player.play_note(note_value, duration=duration_seconds, waveform_type=wave_type)
+        self.note_player.play_note(note_value, duration=duration_seconds, waveform_type=self.model.instrument_waveform(row))
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
-        new_value = event.value
-        self.phrase.update_cell_at(self.selected_cell, new_value)
+        # Invalid values leave the cell as it was
+        self.model.set_cell_text(self.selected_cell.row, self.selected_cell.column, event.value)
+        self.sync_table()
         self.query_one("#edit_input", Input).display = False
 
     def convert_table_to_track(self):
-        """Convert the current table data to a Track with specified duration and wave values"""
-        track = Track("phrase")
-        
-        # Get all notes from the table (15 rows)
-        for row_index in range(15):
-            # Get the note, duration, and wave from the columns
-            note_value = self.phrase.get_cell_at(Coordinate(row_index, 0))
-            duration_input = self.phrase.get_cell_at(Coordinate(row_index, 1))
-            wave_value = self.phrase.get_cell_at(Coordinate(row_index, 2))
-            
-            # Skip empty notes (treat as rest)
-            if not note_value or note_value == "----":
-                continue
-
-            # Each row represents a 16th note, so duration_beats = 0.25 (1/4) (1 being a quater note)
-            duration_beats = 0.25
-            if duration_input and duration_input != "----":
-                try:
-                    numerator_str, denominator_str = duration_input.split("/") 
-                    numerator = int(numerator_str)
-                    denominator = int(denominator_str)
-
-                    duration_beats = (numerator / denominator) * 4 
-                    # 1 is a quater note or beat, so if input is 1/4 I want the user to have a quater note meaning 1/4 * 4 = 1 quater note
-                except:
-                    duration_beats = 0.25  # Default to 16th note
-                
-            # start_beat is the row index * 0.25
-            start_beat = row_index * 0.25
-            
-            # Use specified wave type or default to square
-            wave_type = wave_value if wave_value and wave_value != "------" else "square"
-            
-            # Create NoteEvent and add to track
-            note_event = NoteEvent(
-                note=note_value,
-                start_beat=start_beat,
-                duration_beats=duration_beats,
-                volume=0.1,
-                waveform_type=wave_type
-            )
-            track.add_note(note_event)
-        
-        return track
+        """Convert the current phrase to a Track with specified duration and instrument values"""
+        return self.model.to_track("phrase")
 
-    def play_phrase_sequence(self):
-        """Play the current phrase as a sequence with row highlighting"""
+    def play_phrase_sequence(self, start_row=0):
+        """Play the current phrase as a sequence with row highlighting, starting at start_row"""
         try:
-            # Convert table to track
-            track = self.convert_table_to_track()
-            
-            # Create sequencer and add track
-            sequencer = Sequencer(bpm=120)
-            sequencer.add_track(track)
+            sequencer = Sequencer(bpm=self.BPM)
+            start_beat = start_row * PhraseModel.ROW_BEATS
+            if self.prerendered is not None and self.prerendered[0] == self.render_generation:
+                # Seeking into the ready buffer is just a view
+                output = self.prerendered[1][sequencer.phrase_samples(start_beat):]
+            else:
+                # Edited within the debounce window, render only what's after start_beat
+                output = self.build_sequencer().render(self.model.length_beats, self.PLAYBACK_LOOPS,
+                                                       start_beat=start_beat)
             
-            # Start the highlighting loop in the background
+            # Start the highlighting loop in the background, replacing the one still running
+            if self.playback_highlight_task is not None:
+                self.playback_highlight_task.cancel()
             self.playback_highlight_task = asyncio.create_task(
-                self.playback_highlight_loop(bpm=120, num_loops=2)
+                self.playback_highlight_loop(sequencer.tempo_map, num_loops=self.PLAYBACK_LOOPS, start_row=start_row)
             )
             
-            # Play the sequence (4 beats = 1 measure of 16th notes)
-            # sequencer.play_once(4)
-            sequencer.loop_output_and_play(duration=4, num_of_loops=2)
+            # Play from a callback stream so the highlighting loop keeps running
+            # and the visualizer is fed straight from the audio thread
+            if self.playback_stream is not None:
+                self.playback_stream.close()
+            visualizer = self.app.query_one(Visualizer)
+            self.playback_stream = sequencer.start_playback(output, tap=visualizer.ring.push)
             
         except Exception as e:
             print(f"Error playing phrase sequence: {e}")
@@ -515,6 +532,13 @@ class ChipBoy(App):
         height: 90%;
         width: 60%;
     }
+
+    #visualizer {
+        dock: right;
+        width: 40%;
+        height: auto;
+        padding: 0 1;
+    }
     
     #status_bar {
         height: 1;
@@ -531,6 +555,10 @@ class ChipBoy(App):
     }
     """
 
+    def __init__(self, phrase_rows=15, **kwargs):
+        super().__init__(**kwargs)
+        self.phrase_rows = phrase_rows
+
     def on_mount(self) -> None:
         self.theme = "tokyo-night"
         self.status_bar = self.query_one("#status_bar", Static)
@@ -539,11 +567,14 @@ class ChipBoy(App):
         yield Header()
         yield Static(id="status_bar")
         yield Footer()
-        yield Phrases()
+        yield Visualizer(id="visualizer")
+        yield Phrases(num_rows=self.phrase_rows)
 
     def action_toggle_dark(self) -> None:
         self.theme = ("textual-dark" if self.theme == "textual-light" else "textual-light")
 
 if __name__ == "__main__":
-    app = ChipBoy()
+    # Optional phrase length in rows, e.g. `python user_interface.py 256`
+    phrase_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    app = ChipBoy(phrase_rows=phrase_rows)
     app.run()
@@ -0,0 +1,114 @@
+import numpy as np
+from textual.widgets import Static
+
+
+class SampleRing:
+    """Preallocated single-producer ring buffer of decimated audio samples
+
+    The audio callback is the only writer: it copies a decimated block in and
+    then publishes it by advancing write_count. Readers copy out the most
+    recent samples without taking any lock, so the audio thread never waits on
+    the UI; a reader racing the writer at worst sees a torn frame.
+    """
+
+    def __init__(self, capacity=8192, decimation=4):
+        # Power of two so wrapping is a mask
+        self.capacity = 1 << (capacity - 1).bit_length()
+        self.decimation = decimation
+        self.samples = np.zeros(self.capacity, dtype=np.float32)
+        self.write_count = 0
+        # Keeps decimation phase continuous across blocks
+        self._skip = 0
+
+    def push(self, block):
+        """Called from the audio callback with each output block"""
+        if block.ndim == 2:
+            block = block[:, 0]
+        decimated = block[self._skip::self.decimation]
+        self._skip = (self._skip - len(block)) % self.decimation
+        n = min(len(decimated), self.capacity)
+        if n == 0:
+            return
+        decimated = decimated[-n:]
+
+        start = self.write_count & (self.capacity - 1)
+        first = min(n, self.capacity - start)
+        self.samples[start:start + first] = decimated[:first]
+        self.samples[:n - first] = decimated[first:]
+        self.write_count += n
+
+    def latest(self, n, out=None):
+        """Copy the newest n samples (oldest first) into out"""
+        n = min(n, self.capacity)
+        if out is None:
+            out = np.empty(n, dtype=np.float32)
+        end = self.write_count & (self.capacity - 1)
+        start = end - n
+        if start >= 0:
+            out[:] = self.samples[start:end]
+        else:
+            out[:-start] = self.samples[start:]
+            out[-start:] = self.samples[:end]
+        return out
+
+
+class Visualizer(Static):
+    """Oscilloscope and spectrum of whatever the audio stream is playing"""
+
+    # Redraws per second, capped so the visualizer stays cheap
+    FPS = 20
+    SCOPE_HEIGHT = 8
+    SPECTRUM_HEIGHT = 8
+    FFT_SIZE = 512
+    # Frames stacked into one batched rfft call and averaged
+    FFT_FRAMES = 4
+    BARS = " ▁▂▃▄▅▆▇█"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.ring = SampleRing()
+        self.last_count = -1
+        self.window = np.hanning(self.FFT_SIZE).astype(np.float32)
+        # Scales a full-scale sine to 0 dB
+        self.fft_scale = 2 / self.window.sum()
+        self.history = np.zeros(self.FFT_SIZE * self.FFT_FRAMES, dtype=np.float32)
+
+    def on_mount(self) -> None:
+        self.set_interval(1 / self.FPS, self.refresh_view)
+
+    def refresh_view(self):
+        # Nothing new since the last frame, keep the previous drawing
+        if self.ring.write_count == self.last_count:
+            return
+        self.last_count = self.ring.write_count
+
+        width = max(self.size.width, 8)
+        self.ring.latest(len(self.history), out=self.history)
+        scope = self.draw_scope(self.history[-width * 2:], width)
+        spectrum = self.draw_spectrum(self.history, width)
+        self.update(scope + "\n" + spectrum)
+
+    def draw_scope(self, samples, width):
+        height = self.SCOPE_HEIGHT
+        columns = samples[::max(len(samples) // width, 1)][:width]
+        rows = np.clip(((1 - columns) / 2 * (height - 1)).round().astype(int), 0, height - 1)
+        grid = np.full((height, len(columns)), " ")
+        grid[rows, np.arange(len(columns))] = "•"
+        return "\n".join("".join(line) for line in grid)
+
+    def draw_spectrum(self, samples, width):
+        height = self.SPECTRUM_HEIGHT
+        frames = samples.reshape(self.FFT_FRAMES, self.FFT_SIZE) * self.window
+        magnitude = np.abs(np.fft.rfft(frames, axis=1)).mean(axis=0) * self.fft_scale
+
+        # Log spaced bands, one per column
+        edges = np.unique(np.geomspace(1, len(magnitude) - 1, width + 1).astype(int))
+        bands = np.maximum.reduceat(magnitude, edges[:-1])
+        db = 20 * np.log10(bands + 1e-9)
+        levels = np.clip((db + 60) / 60, 0, 1) * height * (len(self.BARS) - 1)
+
+        lines = []
+        for row in range(height - 1, -1, -1):
+            cell = np.clip(levels - row * (len(self.BARS) - 1), 0, len(self.BARS) - 1).astype(int)
+            lines.append("".join(self.BARS[i] for i in cell))
+        return "\n".join(lines)